@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Compare the substring scan find_unique_bib_key used to do over every bib
+entry with BibIndex, cold (index built and saved) and warm (index loaded
+from the cache, or already in memory).
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bib_handler import BibIndex
+
+
+def scan_bib_key(bib_path_list, val):
+    keys = []
+    for bib_path in bib_path_list:
+        with open(bib_path, "r", encoding="utf-8") as bib_file:
+            bib_content = bib_file.read()
+        for entry in bib_content.split("\n\n"):
+            if val in entry:
+                keys.append(entry.split("{")[1].split(",")[0].strip())
+        if len(keys) == 1:
+            return keys[0]
+    return ""
+
+
+def write_bib(path, entries):
+    with open(path, "w", encoding="utf-8") as bib:
+        for i in range(entries):
+            bib.write(
+                f"@book{{key{i},\n"
+                f"  title = {{A {{Synthetic}} Book Number {i}}},\n"
+                f"  author = {{Doe, Jane and Roe, Richard}},\n"
+                f"  abstract = {{{'lorem ipsum dolor sit amet ' * 20}}},\n"
+                f"  file = {{/library/books/book-{i}.pdf}},\n"
+                f"}}\n\n"
+            )
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(entries=100000, lookups=20):
+    with tempfile.TemporaryDirectory() as tmp:
+        bib_path = os.path.join(tmp, "library.bib")
+        write_bib(bib_path, entries)
+        print(f"bib: {os.path.getsize(bib_path) / 2**20:.1f} MB, {entries} entries")
+        val = f"/library/books/book-{entries - 1}.pdf"
+        expected, scan = timed(scan_bib_key, [bib_path], val)
+        cache_dir = os.path.join(tmp, "cache")
+        key, cold = timed(BibIndex(cache_dir).find_unique_key, [bib_path], val)
+        assert key == expected
+        key, warm = timed(BibIndex(cache_dir).find_unique_key, [bib_path], val)
+        assert key == expected
+        index = BibIndex(cache_dir)
+        index.find_unique_key([bib_path], val)
+        _, hot = timed(
+            lambda: [index.find_unique_key([bib_path], val) for _ in range(lookups)]
+        )
+        print(f"substring scan:     {scan:.3f}s")
+        print(f"index, cold:        {cold:.3f}s")
+        print(f"index, from cache:  {warm:.3f}s")
+        print(f"index, in memory:   {hot / lookups * 1000:.3f}ms per lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Time extract-toc on a synthetic book, with one process and with several, and
+check the headings it finds.
+
+The book has chapters "第 N 章" set large and chapters "Chapter N" set bold
+in the body size, sections "N.M" bold and a little larger than the body text,
+a printed contents listing every heading, and a running header repeating the
+chapter title on every page. Body lines starting with a number or a chapter
+reference are mixed in. Only the chapters and sections must come out, in
+order.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fitz
+
+from pdf_handler import PdfHelper
+from synthetic import WORDS
+from toc_handler import HeadingDetector
+
+# (text, font size, bold), body size 10, and the level expected or None
+LINE_CASES = [
+    ("Chapter 1 Title", 10, True, 1),
+    ("chapter IV", 12, False, 1),
+    ("Part 2 Results", 16, False, 1),
+    ("Chapter 2 Methods", 10, False, None),
+    ("1.5 kg of flour and some more ordinary body text to wrap", 10, False, None),
+    ("1.5 Flour", 12, False, 2),
+    ("2.3.1 Sifting", 10, True, 3),
+    ("Chapters 3 and 4", 10, True, None),
+]
+
+
+def check_lines():
+    detector = HeadingDetector()
+    for text, size, bold, level in LINE_CASES:
+        page = (1, [(text, size, bold), ("x" * 60, 10, False)], {10: 6000})
+        found = [t for _, t, _ in detector.detect([page])]
+        assert found == ([text] if level else []), (text, found)
+        if level:
+            assert detector.pattern_level(text) == level, text
+    print(f"{len(LINE_CASES)} lines scored as expected")
+
+
+def make_book(path: str, pages: int = 2000, pages_per_section: int = 5, sections_per_chapter: int = 4, seed: int = 0):
+    """Write the book to `path` and return the TOC it should have."""
+    rnd = random.Random(seed)
+    expected = []
+    page_number = 2  # the contents come first
+    chapter = 0
+    while page_number <= pages:
+        chapter += 1
+        title = " ".join(rnd.choice(WORDS) for _ in range(3))
+        heading = f"第 {chapter} 章 {title}" if chapter % 2 else f"Chapter {chapter} {title}"
+        expected.append([1, heading, page_number])
+        for section in range(1, sections_per_chapter + 1):
+            if page_number > pages:
+                break
+            title = " ".join(rnd.choice(WORDS) for _ in range(4))
+            expected.append([2, f"{chapter}.{section} {title}", page_number])
+            page_number += pages_per_section
+
+    doc = fitz.open()
+    contents = doc.new_page()
+    y = 60
+    for _, text, page in expected[:60]:
+        contents.insert_text((36, y), f"{text} {page}", fontsize=11, fontname="china-s")
+        y += 12
+    starts = {page: [] for page in range(2, pages + 1)}
+    for level, text, page in expected:
+        starts[page].append((level, text))
+    chapter_title = ""
+    for page_number in range(2, pages + 1):
+        page = doc.new_page()
+        page.insert_text((36, 24), chapter_title, fontsize=8, fontname="china-s")
+        y = 48
+        for level, text in starts[page_number]:
+            if level == 1 and text.startswith("第"):
+                chapter_title = text
+                page.insert_text((36, y + 18), text, fontsize=18, fontname="china-s")
+                y += 36
+            elif level == 1:
+                chapter_title = text
+                page.insert_text((36, y + 9), text, fontsize=9, fontname="hebo")
+                y += 20
+            else:
+                page.insert_text((36, y + 12), text, fontsize=12, fontname="hebo")
+                y += 20
+        while y < page.rect.height - 48:
+            y += 11
+            roll = rnd.random()
+            if roll < 0.03:
+                line = f"{rnd.randint(1, 9)}.{rnd.randint(0, 9)} kg of {rnd.choice(WORDS)} {rnd.choice(WORDS)}"
+            elif roll < 0.05:
+                line = f"Chapter {rnd.randint(1, chapter)} {rnd.choice(WORDS)} {rnd.choice(WORDS)}"
+            else:
+                line = " ".join(rnd.choice(WORDS) for _ in range(14))
+            page.insert_text((36, y), line, fontsize=9)
+    doc.save(path, garbage=2)
+    return expected
+
+
+def time_extract(path, target, jobs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        toc = PdfHelper(path).extract_toc_from_text(target_pdf=target, jobs=jobs)
+    return time.perf_counter() - start, toc
+
+
+def main(pages: int, jobs: list):
+    check_lines()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "book.pdf")
+        expected = make_book(path, pages=pages)
+        print(f"{pages} pages, {len(expected)} headings")
+        print(f"{'jobs':>5} {'time (s)':>9} {'pages/s':>8} {'speedup':>8}")
+        serial = None
+        for job_count in jobs:
+            elapsed, toc = time_extract(path, os.path.join(tmp, "out.pdf"), job_count)
+            serial = serial or elapsed
+            assert toc == expected, next(
+                (t, e) for t, e in zip(toc + [None] * len(expected), expected) if t != e
+            )
+            assert fitz.open(os.path.join(tmp, "out.pdf")).get_toc() == expected
+            print(f"{job_count:>5} {elapsed:>9.2f} {pages / elapsed:>8.0f} {serial / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument(
+        "--jobs", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1})
+    )
+    args = parser.parse_args()
+    main(args.pages, args.jobs)
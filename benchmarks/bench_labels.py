@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compare label <-> number lookups through PyMuPDF, which recomputes the
+labels of the pages for every lookup, with PdfHelper.page_label_index.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fitz
+
+from pdf_handler import PdfHelper
+
+PAGE_LABELS = [
+    {"startpage": 0, "prefix": "", "style": "A", "firstpagenum": 1},
+    {"startpage": 8, "prefix": "p-", "style": "r", "firstpagenum": 1},
+    {"startpage": 30, "prefix": "", "style": "D", "firstpagenum": 1},
+]
+
+
+def pymupdf_lookups(doc, labels, numbers):
+    for label in labels:
+        doc.get_page_numbers(label=label)
+    for number in numbers:
+        doc.load_page(number - 1).get_label()
+
+
+def index_lookups(helper, labels, numbers):
+    for label in labels:
+        helper._get_page_number(label)
+    for number in numbers:
+        helper._get_page_label(number)
+
+
+def main(pages=1000, lookups=2000, seed=0):
+    rnd = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        doc = fitz.open()
+        for _ in range(pages):
+            doc.new_page()
+        doc.set_page_labels(PAGE_LABELS)
+        path = os.path.join(tmp, "labels.pdf")
+        doc.save(path)
+        numbers = [rnd.randint(1, pages) for _ in range(lookups)]
+        labels = [doc[n - 1].get_label() for n in numbers]
+
+        start = time.perf_counter()
+        pymupdf_lookups(doc, labels, numbers)
+        pymupdf = time.perf_counter() - start
+        helper = PdfHelper(path)
+        start = time.perf_counter()
+        index_lookups(helper, labels, numbers)
+        index = time.perf_counter() - start
+        assert [helper._get_page_label(n) for n in numbers] == labels
+        print(f"{lookups} labels and {lookups} numbers on {pages} pages")
+        print(f"pymupdf: {pymupdf:.3f}s")
+        print(f"index:   {index * 1000:.2f}ms (building it included)")
+
+
+if __name__ == "__main__":
+    main()
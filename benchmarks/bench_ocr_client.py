@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Per-image OCR latency against a local keep-alive server: a bare requests.post
+per image (the old OCRHandler) against one shared OCRClient session, then
+one paddle request per image against batched requests on a server with
+network-like latency.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import requests
+
+import picture_handler
+from ocr_stub import OCRStubServer
+from picture_handler import OCRClient, OCRPool, Picture
+
+
+def post_per_image(url, pictures):
+    for picture in pictures:
+        requests.post(
+            url=url,
+            headers={"Content-type": "application/json"},
+            data=json.dumps({"images": [picture._to_base64()]}),
+        ).json()
+
+
+def shared_client(pictures):
+    with OCRClient("paddle", use_cache=False) as ocr_client:
+        for picture in pictures:
+            picture.get_ocr_result(None, "paddle", ocr_client)
+
+
+def pooled_client(pictures, batch_size):
+    with OCRClient("paddle", use_cache=False) as ocr_client:
+        ocr_client.batch_size = batch_size
+        with OCRPool(ocr_client, None, max_in_flight=1) as ocr_pool:
+            futures = [ocr_pool.submit(picture) for picture in pictures]
+        return [future.result() for future in futures]
+
+
+def main(count=300, latency=0.02):
+    server = OCRStubServer().start()
+    config = picture_handler.read_ocr_config()
+    if not config.has_section("paddle"):
+        config.add_section("paddle")
+    config["paddle"]["url"] = f"{server.url}/predict/ocr"
+    with tempfile.TemporaryDirectory() as tmp:
+        pictures = []
+        for i in range(count):
+            path = os.path.join(tmp, f"{i}.png")
+            with open(path, "wb") as f:
+                f.write(os.urandom(2048))
+            pictures.append(Picture(path))
+        for name, func in [
+            ("requests.post", lambda: post_per_image(config["paddle"]["url"], pictures)),
+            ("OCRClient", lambda: shared_client(pictures)),
+        ]:
+            connections = server.connections
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>14}: {elapsed / count * 1000:.2f} ms/image, "
+                f"{server.connections - connections} connections"
+            )
+        server.delay = latency
+        expected = None
+        for batch_size in [1, 8, 32]:
+            requests_sent = server.requests
+            start = time.perf_counter()
+            texts = pooled_client(pictures, batch_size)
+            elapsed = time.perf_counter() - start
+            expected = expected or texts
+            assert texts == expected
+            print(
+                f"batch size {batch_size:>3}: {elapsed / count * 1000:.2f} ms/image, "
+                f"{server.requests - requests_sent} requests"
+            )
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compare rendering Square annotation snapshots with Page.get_pixmap per clip
+against PageRenderer, which rasterises every clip from one display list.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fitz
+
+from pdf_handler import PageRenderer
+from synthetic import make_pdf
+
+
+def render_per_clip(doc, zoom):
+    return [
+        page.get_pixmap(annots=False, clip=annot.rect, matrix=fitz.Matrix(zoom, zoom))
+        for page in doc
+        for annot in page.annots()
+    ]
+
+
+def render_display_list(doc, zoom):
+    pixmaps = []
+    for page in doc:
+        page_renderer = PageRenderer(page)
+        pixmaps.extend(
+            page_renderer.get_pixmap(
+                annots=False, clip=annot.rect, matrix=fitz.Matrix(zoom, zoom)
+            )
+            for annot in page.annots()
+        )
+    return pixmaps
+
+
+def main(square_counts=(1, 5, 10, 20), pages=10, zoom=2):
+    print(f"{'squares/page':>13} {'per clip (s)':>13} {'display list (s)':>17} {'speed-up':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in square_counts:
+            path = make_pdf(
+                os.path.join(tmp, f"{count}.pdf"),
+                pages=pages,
+                lines_per_page=120,
+                words_per_line=20,
+                squares_per_page=count,
+            )
+            doc = fitz.open(path)
+            timings = []
+            results = []
+            for func in (render_per_clip, render_display_list):
+                start = time.perf_counter()
+                results.append([pix.samples for pix in func(doc, zoom)])
+                timings.append(time.perf_counter() - start)
+            assert results[0] == results[1]
+            print(
+                f"{count:>13} {timings[0]:>13.3f} {timings[1]:>17.3f} {timings[0] / timings[1]:>8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Time and bytes written when saving a small TOC change back to a large PDF,
+as a full rewrite (the old save_doc) and as an incremental update.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_handler import PdfHelper
+from synthetic import make_pdf
+
+
+def save_toc(path, compact):
+    pdf = PdfHelper(path)
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    pdf.doc.set_toc([[1, f"Chapter {i}", i + 1] for i in range(0, pdf.doc.page_count, 20)])
+    pdf.save_doc(compact=compact)
+    elapsed = time.perf_counter() - start
+    pdf.doc.close()
+    written = os.path.getsize(path) if compact else os.path.getsize(path) - size
+    return elapsed, written
+
+
+def main(page_counts=(100, 500, 2000)):
+    print(f"{'pages':>6} {'file (MB)':>10} {'full (s)':>9} {'full (MB)':>10} {'incr (s)':>9} {'incr (KB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            source = make_pdf(os.path.join(tmp, f"{pages}.pdf"), pages=pages)
+            size = os.path.getsize(source)
+            path = os.path.join(tmp, "book.pdf")
+            shutil.copy(source, path)
+            full_time, full_written = save_toc(path, compact=True)
+            shutil.copy(source, path)
+            incr_time, incr_written = save_toc(path, compact=False)
+            print(
+                f"{pages:>6} {size / 2**20:>10.1f} {full_time:>9.3f} {full_written / 2**20:>10.1f}"
+                f" {incr_time:>9.3f} {incr_written / 2**10:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare page-number-to-label run as a new pdfhelper process every time with
+the same lookup sent to a running `pdfhelper serve`.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic import make_pdf
+
+PDFHELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pdfhelper.py")
+
+
+def wait_for_socket(socket_path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socket_path):
+        if time.monotonic() > deadline:
+            raise Exception("The server did not start")
+        time.sleep(0.05)
+
+
+def main(pages=1000, process_runs=20, server_runs=2000):
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_pdf(os.path.join(tmp, "book.pdf"), pages=pages, lines_per_page=5)
+        start = time.perf_counter()
+        for i in range(process_runs):
+            subprocess.run(
+                [sys.executable, PDFHELPER, "page-number-to-label", str(i + 1), pdf_path],
+                check=True,
+                capture_output=True,
+            )
+        per_process = (time.perf_counter() - start) / process_runs
+
+        socket_path = os.path.join(tmp, "pdfhelper.sock")
+        server = subprocess.Popen(
+            [sys.executable, PDFHELPER, "serve", socket_path],
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_socket(socket_path)
+            with socket.socket(socket.AF_UNIX) as client:
+                client.connect(socket_path)
+                stream = client.makefile("rwb")
+                start = time.perf_counter()
+                for i in range(server_runs):
+                    request = {
+                        "path": pdf_path,
+                        "method": "get_page_label",
+                        "args": {"number": i % pages + 1},
+                    }
+                    stream.write(json.dumps(request).encode("utf-8") + b"\n")
+                    stream.flush()
+                    assert "result" in json.loads(stream.readline())
+                per_request = (time.perf_counter() - start) / server_runs
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"new process: {per_process * 1000:.2f}ms per lookup")
+        print(f"server:      {per_request * 1000:.3f}ms per lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Check the import cost of every pdfhelper subcommand with python -X importtime.
+
+Each subcommand runs once on a small synthetic PDF. The imports it pays for
+on top of fitz, which every subcommand needs, are held against a budget, and
+modules a subcommand must not load (Mako outside export-annot, requests
+without OCR) are reported. Exits with 1 when a budget or a rule is broken.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic import make_pdf
+
+PDFHELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pdfhelper.py")
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+# ms of imports on top of fitz
+BUDGETS = {
+    "export-toc": 60,
+    "import-toc": 60,
+    "extract-toc": 60,
+    "delete-annot": 60,
+    "export-xfdf-annot": 70,
+    "import-xfdf-annot": 70,
+    "export-annot": 250,
+    "export-info": 70,
+    "import-info": 70,
+    "page-label-to-number": 60,
+    "page-number-to-label": 60,
+}
+
+# top level packages each subcommand must not import
+FORBIDDEN = {command: {"requests", "mako"} for command in BUDGETS}
+FORBIDDEN["export-annot"] = {"requests"}
+
+
+def commands(tmp, pdf_path):
+    toc_path = os.path.join(tmp, "toc.txt")
+    with open(toc_path, "w") as toc:
+        toc.write("- One#1\n  - Two#2\n")
+    xfdf_path = os.path.join(tmp, "annots.xfdf")
+    info_path = os.path.join(tmp, "info.xml")
+    return [
+        ("export-toc", [os.path.join(tmp, "export.txt")]),
+        ("import-toc", [toc_path]),
+        ("extract-toc", ["--overwrite", "--target", os.path.join(tmp, "extracted.pdf")]),
+        ("delete-annot", []),
+        ("export-xfdf-annot", [xfdf_path]),
+        ("import-xfdf-annot", [xfdf_path]),
+        ("export-annot", [os.path.join(tmp, "annots.org"), "--annot-image-dir", tmp]),
+        ("export-info", [info_path]),
+        ("import-info", [info_path]),
+        ("page-label-to-number", ["1"]),
+        ("page-number-to-label", ["1"]),
+    ]
+
+
+def import_times(command, args, pdf_path):
+    """Return {module: (self µs, cumulative µs)} of the modules pdfhelper.py
+    imports in one run, leaving out the ones of the interpreter startup."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", PDFHELPER, command] + args + [pdf_path],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise Exception(f"{command} failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        if not match.group(3) and match.group(4) == "site":
+            modules = {}  # everything so far was imported by the startup
+            continue
+        modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules
+
+
+def main(runs=3):
+    print(f"{'command':>21} {'imports (ms)':>13} {'fitz (ms)':>10} {'rest (ms)':>10} {'budget':>7}")
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_pdf(os.path.join(tmp, "source.pdf"), pages=2, highlights_per_page=2)
+        pdf_path = os.path.join(tmp, "book.pdf")
+        for command, args in commands(tmp, pdf_path):
+            # the best of `runs`, the others pay for a cold disk cache
+            best = None
+            for _ in range(runs):
+                shutil.copy(source, pdf_path)
+                modules = import_times(command, args, pdf_path)
+                total = sum(self_time for self_time, _ in modules.values()) / 1000
+                fitz = max(
+                    modules.get(name, (0, 0))[1] for name in ("fitz", "pymupdf")
+                ) / 1000
+                if best is None or total - fitz < best[1] - best[2]:
+                    best = (modules, total, fitz)
+            modules, total, fitz = best
+            rest = total - fitz
+            budget = BUDGETS[command]
+            print(f"{command:>21} {total:>13.1f} {fitz:>10.1f} {rest:>10.1f} {budget:>7}")
+            if rest > budget:
+                failures.append(f"{command}: {rest:.1f}ms of imports on top of fitz, budget {budget}ms")
+            loaded = {name.split(".")[0] for name in modules}
+            for package in sorted(FORBIDDEN[command] & loaded):
+                failures.append(f"{command}: imports {package}")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--runs", type=int, default=3)
+    sys.exit(main(runs=p.parse_args().runs))
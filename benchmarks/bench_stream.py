@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Measure how soon format_annots writes its first line and how much memory it
+holds on growing documents. Both should stay flat with the page count.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_handler import PdfHelper
+from synthetic import make_pdf
+
+
+class FirstLineTimer(object):
+    """A file that only notes when the first line comes in."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_line = None
+        self.lines = 0
+
+    def write(self, s):
+        if self.first_line is None:
+            self.first_line = time.perf_counter() - self.start
+        self.lines += s.count("\n")
+
+    def flush(self):
+        pass
+
+
+def main(page_counts=(50, 200, 800), highlights_per_page=10):
+    print(f"{'pages':>6} {'first line (s)':>15} {'total (s)':>10} {'peak (MB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = make_pdf(
+                os.path.join(tmp, f"{pages}.pdf"),
+                pages=pages,
+                highlights_per_page=highlights_per_page,
+            )
+            helper = PdfHelper(path)
+            out = FirstLineTimer()
+            stdout = sys.stdout
+            tracemalloc.start()
+            sys.stdout = out
+            try:
+                helper.format_annots(annot_image_dir=tmp, with_toc=False)
+            finally:
+                sys.stdout = stdout
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            total = time.perf_counter() - out.start
+            print(
+                f"{pages:>6} {out.first_line:>15.3f} {total:>10.3f} {peak / 2**20:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
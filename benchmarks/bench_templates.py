@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Compare annotation rendering throughput when the Mako template is compiled
+per item (the old format_annots loop), once per run, and loaded from the
+on-disk module cache.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mako.template import Template
+
+from format_annots_template import annot_item_default_format
+from pdf_handler import compile_template
+
+
+def make_items(count: int):
+    return [
+        {
+            "type": "Highlight",
+            "level": 1,
+            "page": i // 10 + 1,
+            "comment": f"comment {i}" if i % 3 == 0 else "",
+            "text": "lorem ipsum dolor sit amet " * 4,
+            "annot_number": f"annot-{i // 10 + 1}-{i % 10}",
+            "annot_id": f"id-{i}",
+            "height": 0.42,
+            "color": "#ffff00",
+            "pic_path": "",
+            "bib_key": "",
+            "pdf_path": "/tmp/book.pdf",
+        }
+        for i in range(count)
+    ]
+
+
+def render_per_item(items):
+    return [Template(annot_item_default_format).render(**item) for item in items]
+
+
+def render_once(items, module_directory=""):
+    template = compile_template(annot_item_default_format, module_directory)
+    return [template.render(**item) for item in items]
+
+
+def main(count=5000):
+    items = make_items(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        render_once(items[:1], tmp)  # fill the module cache
+        scenarios = [
+            ("compile per item", lambda: render_per_item(items)),
+            ("compile once", lambda: render_once(items)),
+            ("module cache", lambda: render_once(items, tmp)),
+        ]
+        expected = None
+        for name, func in scenarios:
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            expected = expected or result
+            assert result == expected
+            print(f"{name:>17}: {count / elapsed:>10.0f} items/sec")
+
+        for name, module_directory in [("compile", ""), ("cached load", tmp)]:
+            start = time.perf_counter()
+            compile_template(annot_item_default_format, module_directory)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>17}: {elapsed * 1000:>10.2f} ms/template")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Compare TocHandler.convert_toc_list_to_pymupdf_toc, which classifies every
+line with one match of TOC_LINE and reads the TOC file as it goes, against the
+parser it replaced, which tried five patterns on every line of a file read
+with readlines().
+
+Both must give the same TOC and page labels, or raise the same error, on the
+edge cases below and on generated TOCs. The timings and peak memory are taken
+on TOCs of growing size.
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from toc_handler import TocHandler, letter_to_int, roman_to_int
+
+EDGE_CASES = [
+    ["- One#1\n", "  - Two#2\n", "    - Three#3\n", "  - Four#4\n", "- Five#5\n"],
+    ["- No page\n", "  - Page #12 \n", "  - Hash#in#title#7\n", "- Trailing #x\n"],
+    ["+ Plus#1", "  + Nested#2", "- Tabs\tin title#3", "- Spaces before hash   #  4  "],
+    ["# 1 = 16\n", "- Shifted#1\n", "# +2\n", "- More#5\n", "# -3\n", "- Less#9\n"],
+    ["#1=-4", "- Negative#10", "#250=5", "- Volume two#250"],
+    ["@label 1=A\n", "@label 5=[p-]i\n", "@label 13=1\n", "@label 20=\n"],
+    ["@label 3=【前言】iv", "@label 9=（附）B", "@label 11=(x) aa", "@label 2 = [a]"],
+    ["@label 7=MCMXCIV", "@label 8=mmxx", "@label 9=ab", "@label 10=007"],
+    ["", "\n", "   \n", "- After blanks#1\n"],
+    ["- Unicode 第 1 章 标题#3\n", "  - 😀 emoji#4\n"],
+    ["- First#1\n", "      - Deep jump#2\n", "  - Back#3\n", "- Top#4\n"],
+    ["    - Indented first line#1\n"],
+    ["- One#1\n", "not a toc line\n"],
+    ["@label 1=a-b"],
+    ["@label x=1"],
+    ["#"],
+    ["- #12"],
+]
+
+
+def reference_convert_toc_list_to_pymupdf_toc(toc_list: list):
+    """The parser TOC_LINE replaced, kept to check against."""
+    toc = []
+    page_labels = []
+    roman_numeral_pattern = (
+        r"^M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})$"
+    )
+
+    page_gap = 0
+    for line in toc_list:
+        page_match = re.match(r"( *)[-+] (.+)# *(\d+) *", line)
+        toc_without_page_match = re.match(r"( *)[-+] ([^#]+) *", line)
+        gap_match = re.match(r" *# *([\+\-]\d+)", line)
+        first_page_match = re.match(r" *# *(\d+) *= *(-?\d+) *", line)
+        label_match = re.match(
+            r"@label *(\d+) *= *([\[【（\(](.*)[\]】）\)])? *([\w\-]*)", line
+        )
+        indent_step = 2
+
+        if page_match or toc_without_page_match:
+            current_indent = (
+                len(page_match.group(1))
+                if page_match
+                else len(toc_without_page_match.group(1))
+            )
+            if current_indent:
+                if current_indent > last_indent:
+                    lvl += 1
+                    indent_step = current_indent - last_indent
+                elif current_indent < last_indent:
+                    lvl -= int((last_indent - current_indent) / indent_step)
+            else:
+                lvl = 1
+            title = (
+                page_match.group(2) if page_match else toc_without_page_match.group(2)
+            )
+            page = int(page_match.group(3)) + page_gap if page_match else -1
+            toc.append([lvl, title, page])
+            last_indent = current_indent
+        elif first_page_match:
+            page_gap = int(first_page_match.group(2)) - int(first_page_match.group(1))
+        elif gap_match:
+            page_gap += int(gap_match.group(1))
+        elif label_match:
+            startpage = int(label_match.group(1)) - 1
+            prefix = label_match.group(3) or ""
+            rule = label_match.group(4) or ""
+
+            if rule == "":
+                style = ""
+                firstpagenum = 1
+            elif re.match(roman_numeral_pattern, rule.upper()):
+                style = "R" if rule.isupper() else "r"
+                firstpagenum = roman_to_int(rule.upper())
+            elif rule.isdigit():
+                style = "D"
+                firstpagenum = int(rule)
+            elif re.match(r"^[a-zA-Z]+$", rule):
+                style = "A" if rule.isupper() else "a"
+                firstpagenum = letter_to_int(rule)
+            else:
+                raise Exception("Unsupported label rule format!")
+
+            page_labels.append(
+                {
+                    "startpage": startpage,
+                    "prefix": prefix,
+                    "style": style,
+                    "firstpagenum": firstpagenum,
+                }
+            )
+        else:
+            if line.strip():
+                raise Exception("Unsupported Format!")
+    return toc, page_labels
+
+
+def make_toc_lines(entries: int, seed: int = 0):
+    """A TOC of `entries` items, up to 4 levels deep, with page shifts, page
+    labels, blank lines and items without pages mixed in."""
+    rnd = random.Random(seed)
+    lines = ["# 1 = 12\n", "@label 1=[Cover]\n", "@label 2=i\n", "@label 12=1\n"]
+    level = 1
+    page = 1
+    for i in range(entries):
+        level = max(1, min(4, level + rnd.choice([-2, -1, 0, 0, 1])))
+        if i == 0:
+            level = 1
+        page += rnd.randint(0, 3)
+        title = f"Section {i} {rnd.choice(['', '第 3 章 ', 'Part #2 ', 'A.B '])}title"
+        indent = "  " * (level - 1)
+        if rnd.random() < 0.05:
+            lines.append(f"{indent}- {title}\n")
+        else:
+            lines.append(f"{indent}{rnd.choice('-+')} {title}#{page}\n")
+        roll = rnd.random()
+        if roll < 0.01:
+            lines.append(f"# {rnd.choice('+-')}{rnd.randint(1, 3)}\n")
+        elif roll < 0.015:
+            prefix = rnd.choice(["A-", "附录"])
+            lines.append(f"@label {page}=[{prefix}]{rnd.choice(['1', 'a', 'IV'])}\n")
+        elif roll < 0.02:
+            lines.append("\n")
+    return lines
+
+
+def parse(func, lines):
+    try:
+        return func(lines)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def check_equivalence():
+    cases = EDGE_CASES + [make_toc_lines(2000, seed) for seed in range(20)]
+    for lines in cases:
+        expected = parse(reference_convert_toc_list_to_pymupdf_toc, lines)
+        actual = parse(TocHandler().convert_toc_list_to_pymupdf_toc, lines)
+        assert actual == expected, (lines[:5], actual, expected)
+    print(f"{len(cases)} TOCs parsed the same by both parsers")
+
+
+def parse_file(toc_path, stream):
+    with open(toc_path, "r") as data:
+        if stream:
+            return TocHandler().convert_toc_list_to_pymupdf_toc(toc_list=data)
+        return reference_convert_toc_list_to_pymupdf_toc(data.readlines())
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def peak_memory(toc_path, stream):
+    tracemalloc.start()
+    result = parse_file(toc_path, stream)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, result
+
+
+def main(sizes=(1000, 10000, 100000, 300000)):
+    check_equivalence()
+    print(
+        f"{'entries':>8} {'old (s)':>8} {'new (s)':>8} {'speedup':>8} "
+        f"{'old peak (MB)':>14} {'new peak (MB)':>14}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for entries in sizes:
+            toc_path = os.path.join(tmp, f"{entries}.txt")
+            with open(toc_path, "w") as data:
+                data.writelines(make_toc_lines(entries))
+            # time and memory apart: tracemalloc slows the parsers down
+            old_time = min(time_call(parse_file, toc_path, False) for _ in range(3))
+            new_time = min(time_call(parse_file, toc_path, True) for _ in range(3))
+            old_peak, old_result = peak_memory(toc_path, stream=False)
+            new_peak, new_result = peak_memory(toc_path, stream=True)
+            assert old_result == new_result
+            print(
+                f"{entries:>8} {old_time:>8.3f} {new_time:>8.3f} {old_time / new_time:>7.1f}x "
+                f"{old_peak / 2**20:>14.1f} {new_peak / 2**20:>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
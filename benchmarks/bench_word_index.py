@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Compare word-to-annotation matching with and without WordIndex as the
+number of highlights per page grows.
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fitz
+
+from pdf_handler import AnnotationHandler, WordIndex
+from synthetic import make_pdf
+
+
+def linear_scan(word_list, rect_lists):
+    words = sorted(word_list, key=lambda w: (w[3], w[0]))
+    return [
+        [[w for w in words if fitz.Rect(w[:4]).intersects(r)] for r in rects]
+        for rects in rect_lists
+    ]
+
+
+def indexed(word_list, rect_lists):
+    index = WordIndex(word_list)
+    return [[index.query(r) for r in rects] for rects in rect_lists]
+
+
+def main(densities=(1, 10, 50, 100, 200), pages=2, repeat=1):
+    print(f"{'highlights/page':>16} {'linear (s)':>12} {'index (s)':>12} {'speed-up':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for density in densities:
+            path = make_pdf(
+                os.path.join(tmp, f"{density}.pdf"),
+                pages=pages,
+                highlights_per_page=density,
+            )
+            doc = fitz.open(path)
+            cases = []
+            for page in doc:
+                rect_lists = [AnnotationHandler(a).rect_list for a in page.annots()]
+                cases.append((page.get_text("words"), rect_lists))
+            for word_list, rect_lists in cases:
+                assert linear_scan(word_list, rect_lists) == indexed(
+                    word_list, rect_lists
+                )
+            t_linear = min(
+                timeit.repeat(
+                    lambda: [linear_scan(*c) for c in cases], number=1, repeat=repeat
+                )
+            )
+            t_index = min(
+                timeit.repeat(
+                    lambda: [indexed(*c) for c in cases], number=1, repeat=repeat
+                )
+            )
+            print(
+                f"{density:>16} {t_linear:>12.4f} {t_index:>12.4f} {t_linear / t_index:>8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Compare peak RSS and throughput of export-xfdf-annot when the whole XFDF is
+built as an ElementTree before writing, and when every annotation is written
+as it is visited.
+
+Each mode runs in its own process, so that their peak RSS can be told apart.
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_handler import PdfHelper
+from synthetic import make_pdf
+
+
+def export_tree(helper, annot_file):
+    root = ET.Element(
+        "xfdf", xmlns="http://ns.adobe.com/xfdf/", attrib={"xml:space": "preserve"}
+    )
+    annots = ET.SubElement(root, "annots")
+    for page in helper.doc.pages():
+        for annot in page.annots():
+            annots.append(helper._xfdf_annot_element(annot))
+    ET.ElementTree(root).write(annot_file, encoding="utf-8", xml_declaration=True)
+
+
+def export_stream(helper, annot_file):
+    helper.export_xfdf_annots(annot_file)
+
+
+def run(mode, pdf_path, annot_file):
+    helper = PdfHelper(pdf_path)
+    start = time.perf_counter()
+    {"tree": export_tree, "stream": export_stream}[mode](helper, annot_file)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+    print(f"{elapsed} {peak}")
+
+
+def main(pages=500, inks_per_page=100, highlights_per_page=100):
+    annots = pages * (inks_per_page + highlights_per_page)
+    print(f"{annots} annots on {pages} pages")
+    print(f"{'mode':>7} {'time (s)':>9} {'annots/s':>9} {'peak RSS (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_pdf(
+            os.path.join(tmp, "ink.pdf"),
+            pages=pages,
+            lines_per_page=10,
+            inks_per_page=inks_per_page,
+            highlights_per_page=highlights_per_page,
+        )
+        outputs = []
+        for mode in ("tree", "stream"):
+            annot_file = os.path.join(tmp, f"{mode}.xfdf")
+            elapsed, peak = map(
+                float,
+                subprocess.run(
+                    [sys.executable, __file__, "--run", mode, pdf_path, annot_file],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout.split()[-2:],
+            )
+            print(f"{mode:>7} {elapsed:>9.2f} {annots / elapsed:>9.0f} {peak / 1024:>14.1f}")
+            with open(annot_file, "rb") as data:
+                outputs.append(data.read())
+        assert outputs[0] == outputs[1]
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        run(*sys.argv[2:5])
+    else:
+        main()
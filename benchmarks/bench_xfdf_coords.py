@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Compare the XFDF coordinate transforms converting one point at a time, as
+they used to, against converting whole point lists, on ink-heavy documents.
+
+The transforms are timed on vertices and XFDF strings read beforehand, so
+that PyMuPDF reading and writing the points is left out; its share is shown
+by the time of export-xfdf-annot and import-xfdf-annot as a whole. Both ways
+must give the same output.
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fitz
+
+from pdf_handler import (
+    PdfHelper,
+    iter_xfdf_annot_tags,
+    parse_xfdf_points,
+    quad_rects,
+    xfdf_point_strings,
+)
+from synthetic import make_pdf
+
+NAMESPACE = "{http://ns.adobe.com/xfdf/}"
+
+
+def export_per_point(vertices):
+    out = []
+    for points, page_height in vertices:
+        if points and isinstance(points[0], list):  # ink
+            gestures = []
+            for sublist in points:
+                gesture_points = []
+                for x, y in sublist:
+                    gesture_points.append(f"{x},{page_height - y}")
+                gestures.append(";".join(gesture_points))
+            out.append(gestures)
+        else:
+            result = []
+            for x, y in points:
+                result.append(x)
+                result.append(page_height - y)
+            out.append(",".join(map(str, result)))
+    return out
+
+
+def export_bulk(vertices):
+    out = []
+    for points, page_height in vertices:
+        if points and isinstance(points[0], list):  # ink
+            out.append([";".join(xfdf_point_strings(s, page_height)) for s in points])
+        else:
+            out.append(",".join(xfdf_point_strings(points, page_height)))
+    return out
+
+
+def import_per_point(strings):
+    out = []
+    for kind, text, page_height in strings:
+        if kind == "coords":
+            coords_list = list(map(float, text.split(",")))
+            vertices = []
+            for i in range(0, len(coords_list), 2):
+                vertices.append((coords_list[i], page_height - coords_list[i + 1]))
+            out.append(
+                [
+                    fitz.Quad(vertices[i * 4 : i * 4 + 4]).rect
+                    for i in range(int(len(vertices) / 4))
+                ]
+            )
+        else:
+            out.append(
+                [
+                    (float(p.split(",")[0]), page_height - float(p.split(",")[1]))
+                    for p in text.split(";")
+                ]
+            )
+    return out
+
+
+def import_bulk(strings):
+    out = []
+    for kind, text, page_height in strings:
+        points = parse_xfdf_points(text, page_height)
+        out.append(quad_rects(points) if kind == "coords" else points)
+    return out
+
+
+def read_inputs(pdf_path, annot_file):
+    """The vertices of every annot in `pdf_path`, and the coords and gestures
+    of every annot in `annot_file`, with their page heights."""
+    helper = PdfHelper(pdf_path)
+    vertices = [
+        (annot.vertices, page.rect.height)
+        for page in helper.doc
+        for annot in page.annots()
+    ]
+    strings = []
+    for annot_tag in iter_xfdf_annot_tags(annot_file, NAMESPACE):
+        page_height = helper.doc[int(annot_tag.get("page"))].rect.height
+        if annot_tag.get("coords"):
+            strings.append(("coords", annot_tag.get("coords"), page_height))
+        for gesture in annot_tag.iter(f"{NAMESPACE}gesture"):
+            strings.append(("gesture", gesture.text, page_height))
+    return vertices, strings
+
+
+def best_of(func, *args, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(pages=20, inks_per_page=4, points_per_ink=5000, highlights_per_page=20):
+    points = pages * inks_per_page * points_per_ink
+    print(f"{points} ink points and {pages * highlights_per_page} highlights on {pages} pages")
+    with tempfile.TemporaryDirectory() as tmp:
+        options = dict(pages=pages, lines_per_page=40)
+        pdf_path = make_pdf(
+            os.path.join(tmp, "ink.pdf"),
+            inks_per_page=inks_per_page,
+            points_per_ink=points_per_ink,
+            highlights_per_page=highlights_per_page,
+            **options,
+        )
+        plain = make_pdf(os.path.join(tmp, "plain.pdf"), **options)
+        annot_file = os.path.join(tmp, "annots.xfdf")
+        with contextlib.redirect_stdout(io.StringIO()):
+            export_time, _ = best_of(PdfHelper(pdf_path).export_xfdf_annots, annot_file)
+            import_time, _ = best_of(
+                lambda: PdfHelper(plain).import_xfdf_annots(annot_file), repeat=1
+            )
+        vertices, strings = read_inputs(pdf_path, annot_file)
+
+        print(f"{'':>7} {'per point (s)':>14} {'bulk (s)':>9} {'speedup':>8} {'whole command (s)':>18}")
+        for name, per_point, bulk, inputs, total in [
+            ("export", export_per_point, export_bulk, vertices, export_time),
+            ("import", import_per_point, import_bulk, strings, import_time),
+        ]:
+            per_point_time, per_point_result = best_of(per_point, inputs)
+            bulk_time, bulk_result = best_of(bulk, inputs)
+            assert per_point_result == bulk_result, name
+            print(
+                f"{name:>7} {per_point_time:>14.3f} {bulk_time:>9.3f} "
+                f"{per_point_time / bulk_time:>7.1f}x {total:>18.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
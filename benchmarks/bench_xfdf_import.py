@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Compare import-xfdf-annot parsing the whole XFDF with ET.parse and loading
+the page of every annotation again, against streaming it with iterparse and
+sharing the loaded page between consecutive annotations.
+
+Each mode runs in its own process, so that their peak RSS can be told apart.
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_handler import AnnotTagHandler, PdfHelper
+from synthetic import make_pdf
+
+NAMESPACE = "{http://ns.adobe.com/xfdf/}"
+
+
+def import_tree(helper, annot_file):
+    annots = ET.parse(annot_file).getroot().find(f"{NAMESPACE}annots")
+    for annot_tag in annots:
+        helper._add_xfdf_annot(
+            AnnotTagHandler(annot_tag=annot_tag, namespace=NAMESPACE, pdf_handler=helper)
+        )
+
+
+def import_stream(helper, annot_file):
+    helper.import_xfdf_annots(annot_file)
+
+
+def run(mode, pdf_path, annot_file):
+    helper = PdfHelper(pdf_path)
+    start = time.perf_counter()
+    {"tree": import_tree, "stream": import_stream}[mode](helper, annot_file)
+    elapsed = time.perf_counter() - start
+    count = sum(len(list(page.annots())) for page in helper.doc.pages())
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+    print(f"{elapsed} {peak} {count}")
+
+
+def main(pages=250, highlights_per_page=200):
+    annots = pages * highlights_per_page
+    print(f"{annots} annots on {pages} pages")
+    print(f"{'mode':>7} {'time (s)':>9} {'annots/s':>9} {'peak RSS (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        options = dict(pages=pages, lines_per_page=40)
+        annotated = make_pdf(
+            os.path.join(tmp, "annotated.pdf"),
+            highlights_per_page=highlights_per_page,
+            **options,
+        )
+        annot_file = os.path.join(tmp, "annots.xfdf")
+        PdfHelper(annotated).export_xfdf_annots(annot_file)
+        pdf_path = make_pdf(os.path.join(tmp, "plain.pdf"), **options)
+        for mode in ("tree", "stream"):
+            elapsed, peak, count = map(
+                float,
+                subprocess.run(
+                    [sys.executable, __file__, "--run", mode, pdf_path, annot_file],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout.split()[-3:],
+            )
+            assert count == annots
+            print(f"{mode:>7} {elapsed:>9.2f} {annots / elapsed:>9.0f} {peak / 1024:>14.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        run(*sys.argv[2:5])
+    else:
+        main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the paddle and ocr.space OCR endpoints.
+
+Answers every image with a text derived from its bytes, after an optional
+delay, and counts requests, images and client connections.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_text(image: bytes):
+    return "ocr-" + hashlib.sha256(image).hexdigest()[:12]
+
+
+class OCRStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, delay: float = 0):
+        super().__init__(("127.0.0.1", port), OCRStubRequestHandler)
+        self.delay = delay
+        self.requests = 0
+        self.images = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class OCRStubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.delay)
+        if self.path.startswith("/predict"):  # paddle
+            images = [base64.b64decode(x) for x in json.loads(body)["images"]]
+            result = {"results": [{"data": [{"text": fake_text(x)}]} for x in images]}
+        else:  # ocr.space, multipart upload
+            images = [body]
+            result = {
+                "IsErroredOnProcessing": False,
+                "ParsedResults": [{"ParsedText": fake_text(body)}],
+            }
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.images += len(images)
+        data = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_argparser():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--port", type=int, default=8866)
+    p.add_argument("--delay", type=float, default=0, help="Seconds per request")
+    return p
+
+
+if __name__ == "__main__":
+    args = create_argparser().parse_args()
+    server = OCRStubServer(port=args.port, delay=args.delay)
+    print(f"paddle url: {server.url}/predict/ocr")
+    print(f"ocrspace url: {server.url}/parse/image")
+    server.serve_forever()
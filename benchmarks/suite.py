@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Time every pdfhelper subcommand on synthetic PDFs and store the results as
+JSON, so that runs can be compared.
+
+The corpus is generated with synthetic.make_pdf: a "text" PDF with highlights
+and text annots only, whose export-annot renders no pictures, and a "full" PDF
+with every annotation type, including squares over blank areas whose text
+comes from OCR. OCR goes to a local stub server. With --compare,
+scenarios slower than the old results by more than --threshold are flagged and
+the exit status is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fitz
+
+import picture_handler
+from ocr_stub import OCRStubServer
+from pdf_handler import PdfHelper
+from synthetic import make_pdf
+
+
+class Corpus(object):
+    """The synthetic PDFs and the files the scenarios read, in `tmp`."""
+
+    def __init__(self, tmp: str, options: dict):
+        self.tmp = tmp
+        self.options = options
+        common = {
+            key: options[key]
+            for key in ("pages", "lines_per_page", "toc_entries", "toc_depth", "page_labels")
+        }
+        self.plain = make_pdf(os.path.join(tmp, "plain.pdf"), **common)
+        self.text = make_pdf(
+            os.path.join(tmp, "text.pdf"),
+            highlights_per_page=options["highlights_per_page"],
+            texts_per_page=options["texts_per_page"],
+            **common,
+        )
+        self.full = make_pdf(
+            os.path.join(tmp, "full.pdf"),
+            highlights_per_page=options["highlights_per_page"],
+            texts_per_page=options["texts_per_page"],
+            squares_per_page=options["squares_per_page"],
+            blank_squares_per_page=options["blank_squares_per_page"],
+            inks_per_page=options["inks_per_page"],
+            lines_annots_per_page=options["lines_annots_per_page"],
+            **common,
+        )
+        self.out = os.path.join(tmp, "out")
+        os.mkdir(self.out)
+        self.toc_path = self.path("toc.txt")
+        self.xfdf_path = self.path("annots.xfdf")
+        self.info_path = self.path("info.xml")
+        with contextlib.redirect_stdout(io.StringIO()):
+            PdfHelper(self.full).export_toc(self.toc_path)
+            PdfHelper(self.full).export_xfdf_annots(self.xfdf_path)
+            PdfHelper(self.full).export_info(self.info_path)
+        doc = fitz.open(self.full)
+        self.page_numbers = [str(i + 1) for i in range(doc.page_count)]
+        self.page_labels = [page.get_label() or str(page.number + 1) for page in doc]
+
+    def path(self, name: str):
+        return os.path.join(self.out, name)
+
+    def copy(self, pdf_path: str):
+        """A copy of `pdf_path` for the scenarios that change it."""
+        target = self.path("copy.pdf")
+        shutil.copy(pdf_path, target)
+        return target
+
+
+def export_annot(corpus, pdf_path, **kwargs):
+    image_dir = corpus.path("images")
+    shutil.rmtree(image_dir, ignore_errors=True)
+    os.mkdir(image_dir)
+    PdfHelper(pdf_path).format_annots(
+        output_file=corpus.path("annots.org"),
+        annot_image_dir=image_dir,
+        with_toc=True,
+        **kwargs,
+    )
+
+
+SCENARIOS = {
+    "export-toc": lambda c: PdfHelper(c.full).export_toc(c.path("toc-export.txt")),
+    "import-toc": lambda c: PdfHelper(c.copy(c.plain)).import_toc_from_file(
+        c.toc_path, target_pdf=c.path("toc.pdf")
+    ),
+    "extract-toc": lambda c: PdfHelper(c.copy(c.plain)).extract_toc_from_text(
+        target_pdf=c.path("extracted.pdf"), overwrite=True
+    ),
+    "export-annot": lambda c: export_annot(c, c.text),
+    "export-annot-images": lambda c: export_annot(c, c.full),
+    "export-annot-ocr": lambda c: export_annot(
+        c, c.full, ocr_service="paddle", ocr_cache=False
+    ),
+    "export-xfdf-annot": lambda c: PdfHelper(c.full).export_xfdf_annots(
+        c.path("export.xfdf")
+    ),
+    "import-xfdf-annot": lambda c: PdfHelper(c.copy(c.plain)).import_xfdf_annots(
+        c.xfdf_path, target_pdf=c.path("xfdf.pdf"), save_pdf=True
+    ),
+    "delete-annot": lambda c: PdfHelper(c.copy(c.full)).delete_annots(
+        c.path("deleted.pdf")
+    ),
+    "export-info": lambda c: PdfHelper(c.full).export_info(c.path("export.xml")),
+    "import-info": lambda c: PdfHelper(c.copy(c.plain)).import_info(
+        c.info_path, target_pdf=c.path("info.pdf"), save_pdf=True
+    ),
+    "page-label-to-number": lambda c: PdfHelper(c.full).get_page_numbers(c.page_labels),
+    "page-number-to-label": lambda c: PdfHelper(c.full).get_page_labels(c.page_numbers),
+}
+
+
+def time_scenario(func, corpus, repeat: int):
+    runs = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func(corpus)
+            runs.append(time.perf_counter() - start)
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def run_suite(options: dict, repeat: int = 3, scenarios: list = None, ocr_latency: float = 0):
+    server = OCRStubServer(delay=ocr_latency).start()
+    config = picture_handler.read_ocr_config()
+    if not config.has_section("paddle"):
+        config.add_section("paddle")
+    config["paddle"]["url"] = f"{server.url}/predict/ocr"
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "machine": platform.machine(),
+        "corpus": options,
+        "repeat": repeat,
+        "scenarios": {},
+    }
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus = Corpus(tmp, options)
+            for name in scenarios or SCENARIOS:
+                results["scenarios"][name] = time_scenario(SCENARIOS[name], corpus, repeat)
+                print(f"{name:>21} {results['scenarios'][name]['min']:>9.3f}s", file=sys.stderr)
+    finally:
+        server.stop()
+    return results
+
+
+def compare(old: dict, new: dict, threshold: float):
+    """Print old and new times side by side, return the regressed scenarios."""
+    if old.get("corpus") != new.get("corpus"):
+        print("warning: the results are for different corpora", file=sys.stderr)
+    regressions = []
+    print(f"{'scenario':>21} {'old (s)':>9} {'new (s)':>9} {'change':>8}")
+    for name, result in new["scenarios"].items():
+        if name not in old["scenarios"]:
+            continue
+        old_time = old["scenarios"][name]["min"]
+        ratio = result["min"] / old_time if old_time else 1
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = " REGRESSION"
+            regressions.append(name)
+        print(f"{name:>21} {old_time:>9.3f} {result['min']:>9.3f} {ratio - 1:>+8.0%}{flag}")
+    return regressions
+
+
+def create_argparser():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--output", "-o", help="JSON file to write the results to")
+    p.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    p.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Flag scenarios that got slower by more than this fraction",
+    )
+    p.add_argument("--repeat", type=int, default=3, help="Runs per scenario, the fastest counts")
+    p.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Only run these")
+    p.add_argument("--ocr-latency", type=float, default=0, help="Seconds per OCR request")
+    p.add_argument("--pages", type=int, default=100)
+    p.add_argument("--lines-per-page", type=int, default=40)
+    p.add_argument("--highlights-per-page", type=int, default=5)
+    p.add_argument("--texts-per-page", type=int, default=1)
+    p.add_argument("--squares-per-page", type=int, default=1)
+    p.add_argument("--blank-squares-per-page", type=int, default=1)
+    p.add_argument("--inks-per-page", type=int, default=1)
+    p.add_argument("--lines-annots-per-page", type=int, default=1)
+    p.add_argument("--toc-entries", type=int, default=50)
+    p.add_argument("--toc-depth", type=int, default=3)
+    p.add_argument(
+        "--page-label",
+        action="append",
+        help="Page label rule in the @label syntax, e.g. 8=[p-]i. Defaults to 1=A, 5=[p-]i, 13=1",
+    )
+    return p
+
+
+if __name__ == "__main__":
+    args = create_argparser().parse_args()
+    options = {
+        "pages": args.pages,
+        "lines_per_page": args.lines_per_page,
+        "highlights_per_page": args.highlights_per_page,
+        "texts_per_page": args.texts_per_page,
+        "squares_per_page": args.squares_per_page,
+        "blank_squares_per_page": args.blank_squares_per_page,
+        "inks_per_page": args.inks_per_page,
+        "lines_annots_per_page": args.lines_annots_per_page,
+        "toc_entries": args.toc_entries,
+        "toc_depth": args.toc_depth,
+        "page_labels": args.page_label or ["1=A", "5=[p-]i", "13=1"],
+    }
+    results = run_suite(
+        options, repeat=args.repeat, scenarios=args.scenario, ocr_latency=args.ocr_latency
+    )
+    if args.output:
+        with open(args.output, "w") as data:
+            json.dump(results, data, indent=2)
+    if args.compare:
+        with open(args.compare) as data:
+            regressions = compare(json.load(data), results, args.threshold)
+        if regressions:
+            print(f"regressions: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
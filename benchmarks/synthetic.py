@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic PDFs to benchmark pdfhelper against.
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fitz
+
+from toc_handler import TocHandler
+
+ANNOT_DATE = "D:20240101120000Z"
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam"
+).split()
+
+
+def make_pdf(
+    path: str,
+    pages: int = 10,
+    lines_per_page: int = 50,
+    words_per_line: int = 12,
+    highlights_per_page: int = 0,
+    squares_per_page: int = 0,
+    blank_squares_per_page: int = 0,
+    inks_per_page: int = 0,
+    points_per_ink: int = 20,
+    lines_annots_per_page: int = 0,
+    texts_per_page: int = 0,
+    toc_entries: int = 0,
+    toc_depth: int = 1,
+    page_labels: list = None,
+    seed: int = 0,
+):
+    """Write a PDF with `pages` pages of random words and annotations.
+
+    Highlights are placed on runs of words, so every highlight has text to
+    extract. Squares are boxes over random areas of the text, blank squares
+    boxes in the bottom margin, whose text can only come from OCR, inks single
+    random strokes of `points_per_ink` points, line annots random segments and
+    text annots notes at random points.
+
+    The outline has `toc_entries` items spread evenly over the pages, nested
+    `toc_depth` levels deep. `page_labels` are rules in the @label syntax of
+    the TOC format, e.g. ["1=A", "8=[p-]i", "16=1"].
+    """
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        line_height = (page.rect.height - 72) / lines_per_page
+        for line_no in range(lines_per_page):
+            y = 36 + (line_no + 1) * line_height
+            line = " ".join(rnd.choice(WORDS) for _ in range(words_per_line))
+            page.insert_text((36, y), line, fontsize=min(9, line_height * 0.8))
+        page_words = page.get_text("words")
+        for _ in range(highlights_per_page):
+            start = rnd.randrange(len(page_words))
+            words = page_words[start : start + rnd.randint(1, words_per_line)]
+            quads = [fitz.Rect(w[:4]).quad for w in words]
+            annot = page.add_highlight_annot(quads=quads)
+            annot.set_info(creationDate=ANNOT_DATE, modDate=ANNOT_DATE)
+            annot.update()
+        for _ in range(squares_per_page):
+            x0 = rnd.uniform(36, page.rect.width / 2)
+            y0 = rnd.uniform(36, page.rect.height - 136)
+            rect = fitz.Rect(x0, y0, x0 + rnd.uniform(50, 250), y0 + rnd.uniform(20, 100))
+            annot = page.add_rect_annot(rect)
+            annot.set_info(creationDate=ANNOT_DATE, modDate=ANNOT_DATE)
+            annot.update()
+        for _ in range(blank_squares_per_page):
+            x0 = rnd.uniform(36, page.rect.width / 2)
+            rect = fitz.Rect(x0, page.rect.height - 32, x0 + rnd.uniform(50, 250), page.rect.height - 4)
+            annot = page.add_rect_annot(rect)
+            annot.set_info(creationDate=ANNOT_DATE, modDate=ANNOT_DATE)
+            annot.update()
+        for _ in range(inks_per_page):
+            x, y = rnd.uniform(36, page.rect.width - 36), rnd.uniform(36, page.rect.height - 36)
+            stroke = []
+            for _ in range(points_per_ink):
+                x = min(max(x + rnd.uniform(-5, 5), 0), page.rect.width)
+                y = min(max(y + rnd.uniform(-5, 5), 0), page.rect.height)
+                stroke.append((x, y))
+            annot = page.add_ink_annot([stroke])
+            annot.set_info(creationDate=ANNOT_DATE, modDate=ANNOT_DATE)
+            annot.update()
+        for _ in range(lines_annots_per_page):
+            x, y = rnd.uniform(36, page.rect.width - 36), rnd.uniform(36, page.rect.height - 36)
+            end = (
+                min(max(x + rnd.uniform(-100, 100), 0), page.rect.width),
+                min(max(y + rnd.uniform(-100, 100), 0), page.rect.height),
+            )
+            annot = page.add_line_annot((x, y), end)
+            annot.set_info(creationDate=ANNOT_DATE, modDate=ANNOT_DATE)
+            annot.update()
+        for _ in range(texts_per_page):
+            point = (rnd.uniform(36, page.rect.width - 36), rnd.uniform(36, page.rect.height - 36))
+            annot = page.add_text_annot(point, " ".join(rnd.choice(WORDS) for _ in range(8)))
+            annot.set_info(creationDate=ANNOT_DATE, modDate=ANNOT_DATE)
+            annot.update()
+    if toc_entries:
+        doc.set_toc(
+            [
+                [i % max(1, toc_depth) + 1, f"Section {i + 1}", i * pages // toc_entries + 1]
+                for i in range(toc_entries)
+            ]
+        )
+    if page_labels:
+        _, labels = TocHandler().convert_toc_list_to_pymupdf_toc(
+            [f"@label {rule}" for rule in page_labels]
+        )
+        doc.set_page_labels(labels)
+    doc.save(path, garbage=2)
+    doc.close()
+    return path
+
+
+def create_argparser():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("OUTFILE", help="PDF file to write")
+    p.add_argument("--pages", type=int, default=10)
+    p.add_argument("--lines-per-page", type=int, default=50)
+    p.add_argument("--words-per-line", type=int, default=12)
+    p.add_argument("--highlights-per-page", type=int, default=0)
+    p.add_argument("--squares-per-page", type=int, default=0)
+    p.add_argument("--blank-squares-per-page", type=int, default=0)
+    p.add_argument("--inks-per-page", type=int, default=0)
+    p.add_argument("--points-per-ink", type=int, default=20)
+    p.add_argument("--lines-annots-per-page", type=int, default=0)
+    p.add_argument("--texts-per-page", type=int, default=0)
+    p.add_argument("--toc-entries", type=int, default=0)
+    p.add_argument("--toc-depth", type=int, default=1)
+    p.add_argument(
+        "--page-label",
+        action="append",
+        default=[],
+        help="Page label rule in the @label syntax, e.g. 8=[p-]i. Can be given more than once.",
+    )
+    p.add_argument("--seed", type=int, default=0)
+    return p
+
+
+if __name__ == "__main__":
+    args = create_argparser().parse_args()
+    make_pdf(
+        args.OUTFILE,
+        pages=args.pages,
+        lines_per_page=args.lines_per_page,
+        words_per_line=args.words_per_line,
+        highlights_per_page=args.highlights_per_page,
+        squares_per_page=args.squares_per_page,
+        blank_squares_per_page=args.blank_squares_per_page,
+        inks_per_page=args.inks_per_page,
+        points_per_ink=args.points_per_ink,
+        lines_annots_per_page=args.lines_annots_per_page,
+        texts_per_page=args.texts_per_page,
+        toc_entries=args.toc_entries,
+        toc_depth=args.toc_depth,
+        page_labels=args.page_label,
+        seed=args.seed,
+    )
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import json
+import hashlib
+import os
+import re
+
+# both patterns start with a literal, so that the regex engine can skip ahead:
+# a bib is searched twice rather than once with a slower pattern
+ENTRY_START = re.compile(r"@\s*(\w+)\s*[{(]\s*([^,\s]*)")
+# a file field of an entry, not "file =" in the value of another field
+FILE_FIELD = re.compile(r"(?:^|[,{])\s*file\s*=\s*[{\"]", re.IGNORECASE | re.MULTILINE)
+BRACE = re.compile(r"[{}]")
+# JabRef writes the file field as description:path:type
+JABREF_FILE = re.compile(r"^[^:]*:(.+):[^:]*$")
+
+
+class BibIndex(object):
+    """
+    Map the files listed in the `file` field of bib entries to their citation
+    keys.
+
+    Every bib file is parsed once: its index is saved in `cache_dir` along with
+    the mtime and size of the bib, and only rebuilt when one of them changes.
+    """
+
+    index_version = 1
+
+    def __init__(self, cache_dir: str = ""):
+        self.cache_dir = cache_dir or os.path.expanduser(
+            os.path.join(
+                os.environ.get("XDG_CACHE_HOME", "~/.cache"), "pdfhelper", "bib_index"
+            )
+        )
+        # bib path -> ((mtime_ns, size), {file: [key, ...]})
+        self._indexes = {}
+
+    def find_unique_key(self, bib_path_list, val):
+        """
+        Return the key of the entry that lists `val` in its file field, counting
+        the bib files in order until one of them lists it. "" when there is no
+        such entry or more than one.
+        """
+        keys = []
+        for bib_path in bib_path_list:
+            keys.extend(self.get_index(bib_path).get(val, []))
+            if len(keys) == 1:
+                return keys[0]
+        return ""
+
+    def get_index(self, bib_path: str):
+        bib_path = os.path.abspath(bib_path)
+        stat = os.stat(bib_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._indexes.get(bib_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        index = self._load(bib_path, signature)
+        if index is None:
+            with open(bib_path, "r", encoding="utf-8") as bib_file:
+                index = parse_bib_file_index(bib_file.read())
+            self._save(bib_path, signature, index)
+        self._indexes[bib_path] = (signature, index)
+        return index
+
+    def _cache_path(self, bib_path: str):
+        digest = hashlib.sha1(bib_path.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _load(self, bib_path: str, signature):
+        try:
+            with open(self._cache_path(bib_path), "r", encoding="utf-8") as data:
+                cached = json.load(data)
+        except (OSError, ValueError):
+            return None
+        if (
+            cached.get("version") != self.index_version
+            or cached.get("bib_path") != bib_path
+            or cached.get("mtime_ns") != signature[0]
+            or cached.get("size") != signature[1]
+        ):
+            return None
+        return cached["files"]
+
+    def _save(self, bib_path: str, signature, index: dict):
+        cache_path = self._cache_path(bib_path)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(cache_path + ".tmp", "w", encoding="utf-8") as data:
+                json.dump(
+                    {
+                        "version": self.index_version,
+                        "bib_path": bib_path,
+                        "mtime_ns": signature[0],
+                        "size": signature[1],
+                        "files": index,
+                    },
+                    data,
+                    ensure_ascii=False,
+                )
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError:
+            pass  # the index is rebuilt on the next run
+
+
+def parse_bib_file_index(bib_content: str):
+    """Return {file: [key, ...]} for the `file` fields in `bib_content`."""
+    # (start, key) of every entry, key is "" for @comment and the like
+    entries = [
+        (
+            match.start(),
+            ""
+            if match.group(1).lower() in ("comment", "string", "preamble")
+            else match.group(2),
+        )
+        for match in ENTRY_START.finditer(bib_content)
+        if is_line_start(bib_content, match.start())
+    ]
+    index = {}
+    entry_i = -1
+    for match in FILE_FIELD.finditer(bib_content):
+        pos = match.start()
+        while entry_i + 1 < len(entries) and entries[entry_i + 1][0] < pos:
+            entry_i += 1
+        if entry_i < 0 or not entries[entry_i][1]:
+            continue
+        key = entries[entry_i][1]
+        for path in split_file_field(read_field_value(bib_content, match.end() - 1)):
+            keys = index.setdefault(path, [])
+            if key not in keys:
+                keys.append(key)
+    return index
+
+
+def is_line_start(text: str, pos: int):
+    """Whether only blanks come before `pos` on its line."""
+    line_start = text.rfind("\n", 0, pos) + 1
+    return not text[line_start:pos].strip()
+
+
+def read_field_value(text: str, pos: int):
+    """Read the {braced} or "quoted" field value starting at `pos`."""
+    if text[pos] == '"':
+        end = text.find('"', pos + 1)
+        return text[pos + 1 : end if end != -1 else len(text)]
+    depth = 0
+    for brace in BRACE.finditer(text, pos):
+        depth += 1 if brace.group() == "{" else -1
+        if depth == 0:
+            return text[pos + 1 : brace.start()]
+    return text[pos + 1 :]
+
+
+def split_file_field(value: str):
+    """The paths of a file field: a path, a ;-separated list of paths, or
+    JabRef's description:path:type items."""
+    paths = []
+    for item in re.split(r"(?<!\\);", value):
+        item = item.strip()
+        if not item:
+            continue
+        paths.append(item.replace("\\:", ":").replace("\\;", ";"))
+        jabref = JABREF_FILE.match(item)
+        if jabref:
+            paths.append(jabref.group(1).replace("\\:", ":").replace("\\;", ";"))
+    return paths
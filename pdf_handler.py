@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import Future
+import contextlib
 from datetime import datetime
+import functools
+import hashlib
+import heapq
+import json
 import os
+import sys
 from operator import itemgetter
 from typing import List
 import xml.etree.ElementTree as ET
 
 import fitz
-from mako.template import Template
 
-from picture_handler import Picture
-from toc_handler import TocHandler
+from bib_handler import BibIndex
+from picture_handler import OCRClient, OCRPool, Picture
+from profile_handler import NULL_PROFILER, StageProfiler
+from toc_handler import HeadingDetector, PageLabelIndex, TocHandler
 from format_annots_template import (
     toc_item_default_format,
     annot_item_default_format,
@@ -37,6 +48,9 @@ PYMUPDF_ANNOT_TYPE_MAPPING = {
     INK: "Ink",
 }
 
+# annots whose text is extracted from the words under them
+TEXT_EXTRACTION_TYPES = [SQUARE, INK, LINE, HIGHLIGHT, UNDERLINE, SQUIGGLY, STRIKEOUT]
+
 PYMUPDF_LINE_ENDING_STYLE_MAPPING = {
     1: "Square",
     2: "Circle",
@@ -76,6 +90,34 @@ def is_annot_type_name_in_list(annot_type_name: str, annot_type_list: list[int])
     return annot_type_name.lower() in annot_type_name_list
 
 
+def xfdf_point_strings(points, page_height: float):
+    """
+    Format the (x, y) `points` of a PyMuPDF page as the "x,y" of XFDF, where y
+    goes up from the bottom of the page instead of down from its top.
+    """
+    return [f"{x},{page_height - y}" for x, y in points]
+
+
+def parse_xfdf_points(text: str, page_height: float):
+    """
+    Read the points of an XFDF coordinate string, "x0,y0,x1,y1,..." or
+    "x0,y0;x1,y1;...", as (x, y) on a PyMuPDF page.
+    """
+    values = list(map(float, text.replace(";", ",").split(",")))
+    if len(values) % 2:
+        raise ValueError(f"Odd number of coordinates: {text}")
+    values[1::2] = [page_height - y for y in values[1::2]]
+    return list(zip(values[::2], values[1::2]))
+
+
+def quad_rects(points):
+    """The rects of the quads of `points`, four points each. A last
+    incomplete quad is dropped."""
+    return [
+        fitz.Quad(points[i : i + 4]).rect for i in range(0, len(points) - 3, 4)
+    ]
+
+
 class PdfHelper(object):
     pymupdf_to_xfdf_mappings = [
         ("modDate", "date"),
@@ -83,8 +125,11 @@ class PdfHelper(object):
         ("creationDate", "creationdate"),
     ]
 
-    def __init__(self, path):
+    def __init__(self, path, compact_after: int = 20):
         self.path = path
+        # saving back to `path` appends an incremental update, unless the file
+        # already has `compact_after` of them: then it's rewritten and compacted
+        self.compact_after = compact_after
         self.doc = fitz.open(path)
         self.file_name = os.path.splitext(os.path.split(path)[1])[0]
         self.file_dir = os.path.split(path)[0]
@@ -97,22 +142,35 @@ class PdfHelper(object):
 
     def import_toc_from_file(self, toc_path: str, target_pdf: str = ""):
         with open(toc_path, "r") as data:
-            lines = data.readlines()
-            toc, page_labels = TocHandler().convert_toc_list_to_pymupdf_toc(toc_list=lines)
+            toc, page_labels = TocHandler().convert_toc_list_to_pymupdf_toc(toc_list=data)
             self.doc.set_page_labels(page_labels)
             self.save_toc(toc=toc, target_pdf=target_pdf)
 
     def save_toc(self, toc: list, target_pdf: str = ""):
         self.doc.set_toc(toc)
-        self.save_doc(target=target_pdf)
+        return self.save_doc(target=target_pdf)
 
-    def save_doc(self, target: str = ""):
+    def save_doc(self, target: str = "", compact: bool = False):
         target_path = self._get_target_file_path(target=target, file_type="pdf")
+        if not compact and self._can_save_incrementally(target_path):
+            # only the changed objects are appended to the file
+            self.doc.save(
+                self.path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP
+            )
+            return target_path
         temp_file_path = target_path + "2"
         self.doc.save(temp_file_path, garbage=2)
         os.replace(temp_file_path, target_path)
         return target_path
 
+    def _can_save_incrementally(self, target_path):
+        return (
+            os.path.exists(target_path)
+            and os.path.samefile(target_path, self.path)
+            and self.doc.can_save_incrementally()
+            and self.doc.version_count <= self.compact_after
+        )
+
     def _get_target_file_path(self, target, file_type):
         """If target is a folder, return {target}/{self.file_name}.{file_type};
         If target is empty, return {self.file_dir}/{self.file_name}.{file_type};
@@ -133,24 +191,178 @@ class PdfHelper(object):
         creation_start_date: str = "",
         creation_end_date: str = "",
         run_test: bool = False,  # get 3 annot and 3 pic at most
+        jobs: int = 1,
+        ocr_max_in_flight: int = 4,
+        ocr_cache: bool = True,
+        save_pics: bool = True,  # False: pictures only go to OCR, in memory
+        manifest_path: str = "",  # reuse the results of the last run saved here
+        profiler=NULL_PROFILER,
     ):
-        annot_list = []
+        """Yield the annots in page order, as soon as each one is ready."""
         if not self.doc.has_annots():
-            return annot_list
+            return
+        manifest = (
+            load_annot_manifest(manifest_path, ocr_service, ocr_language)
+            if manifest_path
+            else None
+        )
+        annots = self._get_annots_in_parallel_or_serial(
+            jobs=jobs,
+            run_test=run_test,
+            annot_image_dir=annot_image_dir,
+            ocr_service=ocr_service,
+            ocr_language=ocr_language,
+            zoom=zoom,
+            creation_start_date=creation_start_date,
+            creation_end_date=creation_end_date,
+            save_pics=save_pics,
+            ocr_max_in_flight=ocr_max_in_flight,
+            ocr_cache=ocr_cache,
+            manifest=manifest,
+            profiler=profiler,
+        )
+        if not manifest_path:
+            yield from annots
+            return
+        manifest_annots = {}
+        for annot in annots:
+            manifest_annots.update(annot_manifest_entry(annot))
+            yield annot
+        save_annot_manifest(manifest_path, manifest_annots, ocr_service, ocr_language)
+
+    def _get_annots_in_parallel_or_serial(
+        self,
+        jobs: int = 1,
+        run_test: bool = False,
+        annot_image_dir: str = "",
+        ocr_service: str = "",
+        ocr_language: str = "",
+        zoom: int = 4,
+        creation_start_date: str = "",
+        creation_end_date: str = "",
+        save_pics: bool = True,
+        ocr_max_in_flight: int = 4,
+        ocr_cache: bool = True,
+        manifest: dict = None,
+        profiler=NULL_PROFILER,
+    ):
+        kwargs = {
+            "annot_image_dir": annot_image_dir,
+            "ocr_service": ocr_service,
+            "ocr_language": ocr_language,
+            "zoom": zoom,
+            "creation_start_date": creation_start_date,
+            "creation_end_date": creation_end_date,
+            "save_pics": save_pics,
+            "ocr_max_in_flight": ocr_max_in_flight,
+            "ocr_cache": ocr_cache,
+            "manifest": manifest,
+        }
+        page_numbers = list(range(self.doc.page_count))
+        if jobs > 1 and not run_test:
+            # fitz documents can't be shared between processes: every worker
+            # opens its own. Several small chunks per worker keep the load
+            # balanced, map() keeps them in page order. Chunks are capped so
+            # the first ones come back early on long documents.
+            chunk_size = max(1, min(16, -(-len(page_numbers) // (jobs * 4))))
+            chunks = [
+                page_numbers[i : i + chunk_size]
+                for i in range(0, len(page_numbers), chunk_size)
+            ]
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = executor.map(
+                    _get_annots_in_pages,
+                    [self.path] * len(chunks),
+                    chunks,
+                    [kwargs] * len(chunks),
+                    [profiler.enabled] * len(chunks),
+                )
+                for chunk_annots, stats in results:
+                    if stats:
+                        profiler.merge(stats)
+                    yield from chunk_annots
+            return
+        yield from self._get_annots_in_pages(
+            page_numbers, run_test=run_test, profiler=profiler, **kwargs
+        )
+
+    def _get_annots_in_pages(
+        self,
+        page_numbers: List[int],
+        ocr_service: str = "",
+        ocr_language: str = "",
+        ocr_max_in_flight: int = 4,
+        ocr_cache: bool = True,
+        profiler=NULL_PROFILER,
+        **kwargs,
+    ):
+        if not ocr_service:
+            yield from self._collect_annots_in_pages(
+                page_numbers, profiler=profiler, **kwargs
+            )
+            return
+        # OCR runs in the background while the next pages are processed. Annots
+        # are held back until their text is in, but no more than `window` of
+        # them, so the pictures waiting for OCR don't pile up.
+        with OCRClient(
+            ocr_service, use_cache=ocr_cache, max_connections=ocr_max_in_flight
+        ) as ocr_client, OCRPool(
+            ocr_client,
+            ocr_language,
+            max_in_flight=ocr_max_in_flight,
+            profiler=profiler,
+        ) as ocr_pool:
+            window = 2 * max(1, ocr_max_in_flight) * max(1, ocr_client.batch_size)
+            pending = deque()
+            for annot in self._collect_annots_in_pages(
+                page_numbers, ocr_pool=ocr_pool, profiler=profiler, **kwargs
+            ):
+                pending.append(annot)
+                while pending and (
+                    len(pending) > window or not _is_ocr_pending(pending[0])
+                ):
+                    yield _resolve_ocr_text(pending.popleft(), ocr_pool)
+            while pending:
+                yield _resolve_ocr_text(pending.popleft(), ocr_pool)
+
+    def _collect_annots_in_pages(
+        self,
+        page_numbers: List[int],
+        annot_image_dir: str = "",
+        zoom: int = 4,
+        creation_start_date: str = "",
+        creation_end_date: str = "",
+        run_test: bool = False,
+        ocr_pool: OCRPool = None,
+        save_pics: bool = True,
+        manifest: dict = None,
+        profiler=NULL_PROFILER,
+    ):
         annot_count = 0
         extracted_pic_count = 0
-        for page in self.doc.pages():
+        for page_number in page_numbers:
+            with profiler.stage("load_page", page=page_number + 1):
+                page = self.doc.load_page(page_number)
             if run_test and annot_count > 2 and extracted_pic_count > 2:
                 break
             annot_num = 0
-            word_list = page.get_text("words")  # list of words on page
-            word_list.sort(key=lambda w: (w[3], w[0]))  # ascending y, then x
+            annots = []
             for annot in page.annots():
                 annot_date = parse_date(annot.info.get("creationDate") or annot.info.get("modDate"))
                 if creation_start_date and annot_date < parse_date(creation_start_date):
                     continue
                 if creation_end_date and annot_date > parse_date(creation_end_date):
                     continue
+                annots.append((annot, annot_date))
+            if not annots:
+                continue
+            page_words = PageWords.for_annots(
+                page, [annot for annot, _ in annots], profiler=profiler
+            )
+            page_renderer = PageRenderer(page)
+            for annot, annot_date in annots:
                 annot_handler = AnnotationHandler(annot)
                 page_num = page.number + 1
                 annot_number = f"annot-{page_num}-{annot_num}"
@@ -158,37 +370,69 @@ class PdfHelper(object):
                     annot_image_dir,
                     f'{self.file_name.replace(" ", "-")}-{annot_number}.png',
                 )
-                if annot_handler.save_pic(picture_path, zoom):
-                    extracted_pic_count += 1
-                else:
-                    picture_path = ""
-                text = annot_handler.get_text(
-                    wordlist=word_list,
-                    picture_path=picture_path,
-                    ocr_service=ocr_service,
-                    ocr_language=ocr_language,
-                )
-                annot_list.append(
-                    {
-                        "type": annot_handler.type_name,
-                        "author": annot.info.get("title"),
-                        "creation_date": annot_date.strftime("%Y-%m-%d"),
-                        "creation_timestamp": annot_date,
-                        "page": page_num,
-                        "comment": annot_handler.content.strip(),
-                        "text": text,
-                        "annot_number": annot_number,
-                        "annot_id": annot.info.get("id"),
-                        "height": annot_handler.height,
-                        "color": annot_handler.stroke_color,
-                        "pic_path": os.path.abspath(picture_path)
-                        if picture_path
-                        else "",
-                    }
+                signature = {
+                    "modDate": annot.info.get("modDate"),
+                    "rect": list(annot.rect),
+                    "zoom": str(zoom),
+                    "picture_path": picture_path,
+                }
+                manifest_key = annot_manifest_key(
+                    page_num, annot.info.get("id"), annot.xref
                 )
+                cached = manifest.get(manifest_key) if manifest else None
+                if (
+                    cached
+                    and cached["signature"] == signature
+                    and (
+                        not (save_pics and cached["pic_path"])
+                        or os.path.exists(cached["pic_path"])
+                    )
+                    # an empty OCR result may be a passing service failure
+                    and not (ocr_pool and cached["pic_path"] and not cached["text"])
+                ):
+                    # unchanged since the last run, page_words and
+                    # page_renderer stay untouched
+                    picture_path = cached["pic_path"]
+                    if picture_path:
+                        extracted_pic_count += 1
+                    text = cached["text"]
+                else:
+                    with profiler.stage("render", page=page_num) as stage:
+                        picture = annot_handler.save_pic(
+                            picture_path, zoom, page_renderer, write=save_pics
+                        )
+                        stage.bytes = picture.file_size if picture else 0
+                    if picture:
+                        extracted_pic_count += 1
+                    else:
+                        picture_path = ""
+                    text = annot_handler.get_text(
+                        page_words=page_words,
+                        picture=picture,
+                        ocr_pool=ocr_pool,
+                    )
+                annot_item = {
+                    "type": annot_handler.type_name,
+                    "author": annot.info.get("title"),
+                    "creation_date": annot_date.strftime("%Y-%m-%d"),
+                    "creation_timestamp": annot_date,
+                    "page": page_num,
+                    "comment": annot_handler.content.strip(),
+                    "text": text,
+                    "annot_number": annot_number,
+                    "annot_id": annot.info.get("id"),
+                    "height": annot_handler.height,
+                    "color": annot_handler.stroke_color,
+                    "pic_path": os.path.abspath(picture_path)
+                    if picture_path
+                    else "",
+                }
+                if manifest is not None:
+                    annot_item["manifest_key"] = manifest_key
+                    annot_item["manifest_signature"] = signature
                 annot_num += 1
                 annot_count += 1
-        return annot_list
+                yield annot_item
 
     def delete_annots(self, target_path: str = ""):
         if not self.doc.has_annots():
@@ -196,7 +440,8 @@ class PdfHelper(object):
         for page in self.doc.pages():
             for annot in page.annots():
                 page.delete_annot(annot)
-        self.save_doc(target=target_path)
+        # an incremental update would keep the deleted annots in the file
+        self.save_doc(target=target_path, compact=True)
 
     def format_annots(
         self,
@@ -212,20 +457,38 @@ class PdfHelper(object):
         annot_list_item_format: str = annot_item_default_format,
         bib_file_list: List = [],
         run_test: bool = False,
+        template_cache_dir: str = "",
+        jobs: int = 1,
+        ocr_max_in_flight: int = 4,
+        ocr_cache: bool = True,
+        incremental: bool = False,
+        manifest_path: str = "",
+        profiler=NULL_PROFILER,
     ):
-        results_items = []
-        results_strs = []
+        """
+        Write the annots, under the outline items when `with_toc`, to
+        `output_file` or stdout. A StageProfiler as `profiler` records how long
+        each stage takes, its `run()` around the call the total time.
+        """
         level = 0
         pdf_path = os.path.abspath(self.path)
-        bib_key = (
-            find_unique_bib_key(bib_path_list=bib_file_list, val=pdf_path)
-            if bib_file_list
-            else ""
-        )
-        if with_toc:
-            results_items.extend(
-                self.toc_dict
-            )  # extend toc before annot to ensure that annot item is after toc item after sorting by page
+        with profiler.stage("bib_key"):
+            bib_key = (
+                find_unique_bib_key(bib_path_list=bib_file_list, val=pdf_path)
+                if bib_file_list
+                else ""
+            )
+        with profiler.stage("compile_template"):
+            toc_item_template = compile_template(
+                toc_list_item_format, module_directory=template_cache_dir
+            )
+            annot_item_template = compile_template(
+                annot_list_item_format, module_directory=template_cache_dir
+            )
+        # the outline is small, sort it by page. The annots come in page order,
+        # so they are merged into it on the fly; toc items go before the annots
+        # of their page
+        toc_items = sorted(self.toc_dict, key=itemgetter("page")) if with_toc else []
         annots = self._get_annots(
             annot_image_dir=annot_image_dir,
             ocr_service=ocr_service,
@@ -234,39 +497,125 @@ class PdfHelper(object):
             creation_start_date=creation_start_date,
             creation_end_date=creation_end_date,
             run_test=run_test,
+            jobs=jobs,
+            ocr_max_in_flight=ocr_max_in_flight,
+            ocr_cache=ocr_cache,
+            # no need to write the pictures when the template never shows them
+            save_pics="pic_path" in annot_list_item_format,
+            manifest_path=self._get_target_file_path(
+                target=manifest_path, file_type="annots.json"
+            )
+            if incremental
+            else "",
+            profiler=profiler,
         )
-        results_items.extend(annots)
-        results_items = sorted(results_items, key=itemgetter("page"))
-        for item in results_items:
-            context = item
-            context["pdf_path"] = pdf_path
-            context["bib_key"] = bib_key
-            if item.get("type") == "toc":
-                level = item.get("level")
-                toc_item_template = Template(toc_list_item_format)
-                string = toc_item_template.render(**context)
-            else:  # note
-                annot_item_template = Template(annot_list_item_format)
-                context["level"] = level
-                string = annot_item_template.render(**context)
-            results_strs.append(string)
-        if not output_file:
-            print("\n".join(results_strs))
-            return
-        with open(output_file, "w") as data:
-            print("\n".join(results_strs), file=data)
-
-    def extract_toc_from_text(self):
-        toc = []
-        for num in range(self.doc.page_count):
-            page = self.doc.load_page(num)
-            text = page.get_text()
-            toc_item = [
-                line for line in text.split("\n") if TocHandler().is_toc_item(line)
+        # every item is written as soon as it's rendered, to a temporary file
+        # so that a failed run leaves the last output intact
+        temp_file_path = output_file + "2" if output_file else ""
+        with (
+            open(temp_file_path, "w")
+            if output_file
+            else contextlib.nullcontext(sys.stdout)
+        ) as data:
+            empty = True
+            for item in heapq.merge(toc_items, annots, key=itemgetter("page")):
+                context = item
+                context["pdf_path"] = pdf_path
+                context["bib_key"] = bib_key
+                with profiler.stage("template", page=item["page"]) as stage:
+                    if item.get("type") == "toc":
+                        level = item.get("level")
+                        string = toc_item_template.render(**context)
+                    else:  # note
+                        context["level"] = level
+                        string = annot_item_template.render(**context)
+                    if profiler.enabled:
+                        stage.bytes = len(string.encode("utf-8"))
+                with profiler.stage("write", page=item["page"]) as write_stage:
+                    print(string, file=data, flush=not output_file)
+                    if profiler.enabled:
+                        write_stage.bytes = stage.bytes + 1
+                empty = False
+            if empty:
+                print(file=data)
+        if output_file:
+            os.replace(temp_file_path, output_file)
+
+    def extract_toc_from_text(
+        self,
+        target_pdf: str = "",
+        jobs: int = 1,
+        heading_detector: HeadingDetector = None,
+        overwrite: bool = False,
+    ):
+        """
+        Detect the headings in the text of the pages with `heading_detector`
+        and save them as the TOC. The pages are read by `jobs` processes.
+        An existing TOC is only replaced with `overwrite`, and nothing is
+        saved when no heading is found. Return the TOC.
+        """
+        if not overwrite and self.doc.get_toc(simple=True):
+            raise Exception("The PDF already has a TOC, use --overwrite to replace it")
+        heading_detector = heading_detector or HeadingDetector()
+        page_numbers = list(range(self.doc.page_count))
+        if jobs > 1:
+            # see _get_annots_in_parallel_or_serial
+            chunk_size = max(1, min(64, -(-len(page_numbers) // (jobs * 4))))
+            chunks = [
+                page_numbers[i : i + chunk_size]
+                for i in range(0, len(page_numbers), chunk_size)
             ]
-            if len(toc_item) < 5:
-                toc.extend([[1, x, num + 1] for x in toc_item])
-        self.save_toc(toc)
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = executor.map(
+                    _get_page_lines,
+                    [self.path] * len(chunks),
+                    chunks,
+                    [heading_detector.max_length] * len(chunks),
+                )
+                pages = [page for chunk_pages in results for page in chunk_pages]
+        else:
+            pages = self._get_page_lines(page_numbers, heading_detector.max_length)
+        toc = heading_detector.detect(pages)
+        if not toc:
+            print("Warning: No heading found, the TOC is left as it is")
+            return toc
+        pdf_path = self.save_toc(toc, target_pdf=target_pdf)
+        print(pdf_path)
+        return toc
+
+    def _get_page_lines(self, page_numbers: List[int], max_length: int = 80):
+        """
+        Return (page number, [(text, font size, bold), ...] of the lines up to
+        `max_length` long, {font size: number of characters}) of each page.
+        """
+        flags = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+        pages = []
+        for page_number in page_numbers:
+            page = self.doc.load_page(page_number)
+            lines = []
+            sizes = {}
+            for block in page.get_text("dict", flags=flags)["blocks"]:
+                for line in block.get("lines", []):
+                    spans = [span for span in line["spans"] if span["text"].strip()]
+                    if not spans:
+                        continue
+                    for span in spans:
+                        size = round(span["size"] * 2) / 2
+                        sizes[size] = sizes.get(size, 0) + len(span["text"])
+                    text = "".join(span["text"] for span in line["spans"]).strip()
+                    if len(text) > max_length:
+                        continue
+                    lines.append(
+                        (
+                            text,
+                            max(round(span["size"] * 2) / 2 for span in spans),
+                            all(_is_bold(span) for span in spans),
+                        )
+                    )
+            pages.append((page_number + 1, lines, sizes))
+        return pages
 
     @property
     def toc_dict(self):
@@ -301,95 +650,109 @@ class PdfHelper(object):
         """
         Export annotations in XFDF format.
 
+        Every annotation is written to the file as soon as it is visited, so the
+        whole document is never held in memory.
+
         Args:
             annot_file (str): Path to the output XFDF file.
         """
         if not self.doc.has_annots():
             return
-
-        root = ET.Element(
-            "xfdf", xmlns="http://ns.adobe.com/xfdf/", attrib={"xml:space": "preserve"}
-        )
-        annots = ET.SubElement(root, "annots")
-
-        for page in self.doc.pages():
-            for annot in page.annots():
-                annot_h = AnnotationHandler(annot)
-                annot_tag = ET.SubElement(annots, annot_h.type_name.lower())
-
-                # Set common attributes
-                annot_attrs = annot.info
-                for old_key, new_key in self.pymupdf_to_xfdf_mappings:
-                    if old_key in annot_attrs:
-                        annot_attrs[new_key] = annot_attrs[old_key]
-                        del annot_attrs[old_key]
-                annot_attrs["page"] = str(annot_h.page.number)
-                annot_attrs["rect"] = annot_h.xfdf_rect_string()
-                annot_attrs["color"] = annot_h.stroke_color
-                if annot_h.fill_color:
-                    annot_attrs["interior-color"] = annot_h.fill_color
-                # TODO annot_attrs["flags"] = str(annot.flags)
-                annot_attrs["flags"] = "print"
-
-                # Set border attributes
-                border_width = annot.border.get("width")
-                if border_width and border_width != -1:
-                    annot_attrs["width"] = str(border_width)
-                if annot.border.get("dashes"):
-                    annot_attrs["style"] = "dash"
-                    annot_attrs["dashes"] = ",".join(
-                        [str(x) for x in annot.border.get("dashes")]
-                    )
-                elif annot.border.get("clouds") and annot.border.get("clouds") > 0:
-                    annot_attrs["style"] = "cloudy"
-                    annot_attrs["intensity"] = str(annot.border.get("clouds"))
-                    # TODO if fringe not set，imported by xchange will be invisible. Haven't found correspoing pymupdf atrributes.
-                    annot_attrs["fringe"] = "9,9,9,9"
-
-                # Add child nodes
-                if annot_h.content:
-                    content_tag = ET.SubElement(annot_tag, "contents")
-                    content_tag.text = annot_h.content
-
-                if annot.has_popup:
-                    popup_tag = ET.SubElement(annot_tag, "popup")
-                    popup_attrs = {
-                        "open": "yes" if annot.is_open else "no",
-                        "page": str(annot_h.page.number),
-                        "rect": annot_h.xfdf_rect_string(type="popup"),
-                    }
-                    popup_tag.attrib = popup_attrs
-
-                # Set type-specific attributes
-                if annot_h.type_name_in_list([TEXT]):
-                    annot_attrs["icon"] = annot.info.get("name") or "Note"
-                elif annot_h.type_name_in_list([LINE]):
-                    annot_attrs["start"], annot_attrs["end"] = annot_h.line_end_points()
-                    line_head_type = annot.line_ends[0]
-                    line_tail_type = annot.line_ends[1]
-                    if line_head_type:
-                        annot_attrs["head"] = PYMUPDF_LINE_ENDING_STYLE_MAPPING[
-                            line_head_type
-                        ]
-                    if line_tail_type:
-                        annot_attrs["tail"] = PYMUPDF_LINE_ENDING_STYLE_MAPPING[
-                            line_tail_type
-                        ]
-                elif annot_h.type_name_in_list([INK]):
-                    inklist = ET.SubElement(annot_tag, "inklist")
-                    gesture_string_list = annot_h.xfdf_ink_gesture_string_list()
-                    for gesture_string in gesture_string_list:
-                        gesture = ET.SubElement(inklist, "gesture")
-                        gesture.text = gesture_string
-                elif annot_h.type_name_in_list(
-                    [HIGHLIGHT, UNDERLINE, STRIKEOUT, SQUIGGLY]
-                ):
-                    annot_attrs["coords"] = annot_h.xfdf_coords_string()
-                annot_tag.attrib = annot_attrs
-
         annot_file = self._get_target_file_path(target=annot_file, file_type="xfdf")
-        tree = ET.ElementTree(root)
-        tree.write(annot_file, encoding="utf-8", xml_declaration=True)
+        with open(annot_file, "w", encoding="utf-8") as data:
+            # the same bytes ElementTree.write gives for the whole tree
+            data.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            data.write(
+                '<xfdf xml:space="preserve" xmlns="http://ns.adobe.com/xfdf/">'
+            )
+            empty = True
+            for page in self.doc.pages():
+                for annot in page.annots():
+                    if empty:
+                        data.write("<annots>")
+                        empty = False
+                    data.write(
+                        ET.tostring(
+                            self._xfdf_annot_element(annot), encoding="unicode"
+                        )
+                    )
+            data.write("<annots />" if empty else "</annots>")
+            data.write("</xfdf>")
+
+    def _xfdf_annot_element(self, annot):
+        annot_h = AnnotationHandler(annot)
+        annot_tag = ET.Element(annot_h.type_name.lower())
+
+        # Set common attributes
+        annot_attrs = annot.info
+        for old_key, new_key in self.pymupdf_to_xfdf_mappings:
+            if old_key in annot_attrs:
+                annot_attrs[new_key] = annot_attrs[old_key]
+                del annot_attrs[old_key]
+        annot_attrs["page"] = str(annot_h.page.number)
+        annot_attrs["rect"] = annot_h.xfdf_rect_string()
+        annot_attrs["color"] = annot_h.stroke_color
+        if annot_h.fill_color:
+            annot_attrs["interior-color"] = annot_h.fill_color
+        # TODO annot_attrs["flags"] = str(annot.flags)
+        annot_attrs["flags"] = "print"
+
+        # Set border attributes
+        border_width = annot.border.get("width")
+        if border_width and border_width != -1:
+            annot_attrs["width"] = str(border_width)
+        if annot.border.get("dashes"):
+            annot_attrs["style"] = "dash"
+            annot_attrs["dashes"] = ",".join(
+                [str(x) for x in annot.border.get("dashes")]
+            )
+        elif annot.border.get("clouds") and annot.border.get("clouds") > 0:
+            annot_attrs["style"] = "cloudy"
+            annot_attrs["intensity"] = str(annot.border.get("clouds"))
+            # TODO if fringe not set，imported by xchange will be invisible. Haven't found correspoing pymupdf atrributes.
+            annot_attrs["fringe"] = "9,9,9,9"
+
+        # Add child nodes
+        if annot_h.content:
+            content_tag = ET.SubElement(annot_tag, "contents")
+            content_tag.text = annot_h.content
+
+        if annot.has_popup:
+            popup_tag = ET.SubElement(annot_tag, "popup")
+            popup_attrs = {
+                "open": "yes" if annot.is_open else "no",
+                "page": str(annot_h.page.number),
+                "rect": annot_h.xfdf_rect_string(type="popup"),
+            }
+            popup_tag.attrib = popup_attrs
+
+        # Set type-specific attributes
+        if annot_h.type_name_in_list([TEXT]):
+            annot_attrs["icon"] = annot.info.get("name") or "Note"
+        elif annot_h.type_name_in_list([LINE]):
+            annot_attrs["start"], annot_attrs["end"] = annot_h.line_end_points()
+            line_head_type = annot.line_ends[0]
+            line_tail_type = annot.line_ends[1]
+            if line_head_type:
+                annot_attrs["head"] = PYMUPDF_LINE_ENDING_STYLE_MAPPING[
+                    line_head_type
+                ]
+            if line_tail_type:
+                annot_attrs["tail"] = PYMUPDF_LINE_ENDING_STYLE_MAPPING[
+                    line_tail_type
+                ]
+        elif annot_h.type_name_in_list([INK]):
+            inklist = ET.SubElement(annot_tag, "inklist")
+            gesture_string_list = annot_h.xfdf_ink_gesture_string_list()
+            for gesture_string in gesture_string_list:
+                gesture = ET.SubElement(inklist, "gesture")
+                gesture.text = gesture_string
+        elif annot_h.type_name_in_list(
+            [HIGHLIGHT, UNDERLINE, STRIKEOUT, SQUIGGLY]
+        ):
+            annot_attrs["coords"] = annot_h.xfdf_coords_string()
+        annot_tag.attrib = annot_attrs
+        return annot_tag
 
     def import_info(
         self, info_file: str = "", target_pdf: str = "", save_pdf: bool = False
@@ -439,90 +802,239 @@ class PdfHelper(object):
     def import_xfdf_annots(
         self, annot_file: str = "", target_pdf: str = "", save_pdf: bool = False
     ):
+        """
+        Import annotations from an XFDF file.
+
+        The file is streamed: every annotation tag is dropped once its annotation
+        is created. Consecutive annotations on the same page, as export-xfdf-annot
+        writes them, share one loaded page.
+        """
         if os.path.isdir(annot_file):
             annot_file = os.path.join(annot_file, f"{self.file_name}.xfdf")
         if not os.path.exists(annot_file):
             raise Exception("No XFDF Annot Found!")
-        tree = ET.parse(annot_file)
-        root = tree.getroot()
         namespace = "{http://ns.adobe.com/xfdf/}"
-        annots = root.find(f"{namespace}annots")
-        if not annots:
-            raise Exception("Wrong Format")
-        for annot_tag in annots:
-            annot_tag_h = AnnotTagHandler(
-                annot_tag=annot_tag, namespace=namespace, pdf_handler=self
-            )
-            page = annot_tag_h.page
-            annot_tag_name = annot_tag_h.name
-
-            if is_annot_type_name_in_list(annot_tag_name, [HIGHLIGHT]):
-                annot = page.add_highlight_annot(quads=annot_tag_h.coords)
-            elif is_annot_type_name_in_list(annot_tag_name, [UNDERLINE]):
-                annot = page.add_underline_annot(quads=annot_tag_h.coords)
-            elif is_annot_type_name_in_list(annot_tag_name, [STRIKEOUT]):
-                annot = page.add_strikeout_annot(quads=annot_tag_h.coords)
-            elif is_annot_type_name_in_list(annot_tag_name, [SQUIGGLY]):
-                annot = page.add_squiggly_annot(quads=annot_tag_h.coords)
-            elif is_annot_type_name_in_list(annot_tag_name, [SQUARE]):
-                annot = page.add_rect_annot(annot_tag_h.rect())
-            elif is_annot_type_name_in_list(annot_tag_name, [TEXT]):
-                annot = page.add_text_annot(
-                    point=annot_tag_h.rect().tl,
-                    text=annot_tag_h.contents_text,
-                    icon=annot_tag.attrib.get("icon"),
-                )
-            elif is_annot_type_name_in_list(annot_tag_name, [INK]):
-                annot = page.add_ink_annot(annot_tag_h.ink_list)
-            elif is_annot_type_name_in_list(annot_tag_name, [LINE]):
-                annot = page.add_line_annot(
-                    annot_tag_h.get_line_ends_point(type="start"),
-                    annot_tag_h.get_line_ends_point(type="end"),
-                )
-                annot.set_line_ends(
-                    annot_tag_h.get_line_ends_type(type="head"),
-                    annot_tag_h.get_line_ends_type(type="tail"),
+        page = None
+        for annot_tag in iter_xfdf_annot_tags(annot_file, namespace):
+            page_number = int(annot_tag.attrib.get("page"))
+            if page is None or page.number != page_number:
+                page = self.doc.load_page(page_number)
+            self._add_xfdf_annot(
+                AnnotTagHandler(
+                    annot_tag=annot_tag, namespace=namespace, pdf_handler=self, page=page
                 )
-            else:
-                raise Exception("Unsupported")
-
-            if not is_annot_type_name_in_list(
-                annot_tag_name, [HIGHLIGHT, STRIKEOUT, UNDERLINE, SQUIGGLY, TEXT]
-            ):
-                annot.set_border(border=annot_tag_h.border_dict)
-            annot.set_colors(colors=annot_tag_h.color_dict)
-            annot.set_info(info=annot_tag_h.attrs)
-            if annot_tag_h.has_popup():
-                annot.set_popup(annot_tag_h.rect(type="popup"))
-                annot.set_open(annot_tag_h.popup_open)
-            annot.update()
+            )
 
         if save_pdf:
             pdf_path = self.save_doc(target=target_pdf)
             print(pdf_path)
 
-    def get_page_number(self, label):
-        page_numbers = self.doc.get_page_numbers(label=label)
-        if len(page_numbers):
-            page_number = page_numbers[0] + 1
+    def _add_xfdf_annot(self, annot_tag_h):
+        annot_tag = annot_tag_h.annot_tag
+        page = annot_tag_h.page
+        annot_tag_name = annot_tag_h.name
+
+        if is_annot_type_name_in_list(annot_tag_name, [HIGHLIGHT]):
+            annot = page.add_highlight_annot(quads=annot_tag_h.coords)
+        elif is_annot_type_name_in_list(annot_tag_name, [UNDERLINE]):
+            annot = page.add_underline_annot(quads=annot_tag_h.coords)
+        elif is_annot_type_name_in_list(annot_tag_name, [STRIKEOUT]):
+            annot = page.add_strikeout_annot(quads=annot_tag_h.coords)
+        elif is_annot_type_name_in_list(annot_tag_name, [SQUIGGLY]):
+            annot = page.add_squiggly_annot(quads=annot_tag_h.coords)
+        elif is_annot_type_name_in_list(annot_tag_name, [SQUARE]):
+            annot = page.add_rect_annot(annot_tag_h.rect())
+        elif is_annot_type_name_in_list(annot_tag_name, [TEXT]):
+            annot = page.add_text_annot(
+                point=annot_tag_h.rect().tl,
+                text=annot_tag_h.contents_text,
+                icon=annot_tag.attrib.get("icon"),
+            )
+        elif is_annot_type_name_in_list(annot_tag_name, [INK]):
+            annot = page.add_ink_annot(annot_tag_h.ink_list)
+        elif is_annot_type_name_in_list(annot_tag_name, [LINE]):
+            annot = page.add_line_annot(
+                annot_tag_h.get_line_ends_point(type="start"),
+                annot_tag_h.get_line_ends_point(type="end"),
+            )
+            annot.set_line_ends(
+                annot_tag_h.get_line_ends_type(type="head"),
+                annot_tag_h.get_line_ends_type(type="tail"),
+            )
         else:
-            page_number = label
+            raise Exception("Unsupported")
+
+        if not is_annot_type_name_in_list(
+            annot_tag_name, [HIGHLIGHT, STRIKEOUT, UNDERLINE, SQUIGGLY, TEXT]
+        ):
+            annot.set_border(border=annot_tag_h.border_dict)
+        annot.set_colors(colors=annot_tag_h.color_dict)
+        annot.set_info(info=annot_tag_h.attrs)
+        if annot_tag_h.has_popup():
+            annot.set_popup(annot_tag_h.rect(type="popup"))
+            annot.set_open(annot_tag_h.popup_open)
+        annot.update()
+
+    @functools.cached_property
+    def page_label_index(self):
+        return PageLabelIndex(self.doc.get_page_labels(), self.doc.page_count)
+
+    def get_page_number(self, label):
+        page_number = self._get_page_number(label)
         print(page_number)
         return page_number
 
     def get_page_label(self, number):
-        page_index = int(number) - 1
-        page_label = self.doc.load_page(page_index).get_label() or str(number)
+        page_label = self._get_page_label(number)
         print(page_label)
         return page_label
 
+    def get_page_numbers(self, labels):
+        """Print the page number of every label in `labels` as soon as it's
+        found, one per line."""
+        page_numbers = []
+        for label in labels:
+            page_numbers.append(self._get_page_number(label))
+            print(page_numbers[-1], flush=True)
+        return page_numbers
+
+    def get_page_labels(self, numbers):
+        """Print the page label of every number in `numbers` as soon as it's
+        found, one per line."""
+        page_labels = []
+        for number in numbers:
+            page_labels.append(self._get_page_label(number))
+            print(page_labels[-1], flush=True)
+        return page_labels
+
+    def _get_page_number(self, label):
+        page_index = self.page_label_index.number(label)
+        return label if page_index is None else page_index + 1
+
+    def _get_page_label(self, number):
+        return self.page_label_index.label(int(number) - 1) or str(number)
+
+
+def annot_manifest_key(page_num, annot_id, xref):
+    # annots without an id are told apart by their xref
+    return f"{page_num}:{annot_id}" if annot_id else f"{page_num}:xref-{xref}"
+
+
+def load_annot_manifest(manifest_path: str, ocr_service: str, ocr_language: str):
+    """
+    Load the annots saved by the last export-annot run, keyed by page and annot
+    id, or xref for annots without one. Nothing is reused when the file is missing or the OCR settings changed.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as data:
+        manifest = json.load(data)
+    if manifest.get("ocr_service") != (ocr_service or "") or manifest.get(
+        "ocr_language"
+    ) != (ocr_language or ""):
+        return {}
+    return manifest.get("annots", {})
+
+
+def annot_manifest_entry(annot):
+    """Take the manifest key and signature off `annot`, return its manifest
+    entry as {key: entry}."""
+    key = annot.pop("manifest_key")
+    signature = annot.pop("manifest_signature")
+    return {
+        key: {
+            "signature": signature,
+            "text": annot["text"],
+            "pic_path": annot["pic_path"],
+        }
+    }
+
+
+def save_annot_manifest(
+    manifest_path: str, annots: dict, ocr_service: str, ocr_language: str
+):
+    manifest = {
+        "ocr_service": ocr_service or "",
+        "ocr_language": ocr_language or "",
+        "annots": annots,
+    }
+    temp_file_path = manifest_path + "2"
+    with open(temp_file_path, "w", encoding="utf-8") as data:
+        json.dump(manifest, data, ensure_ascii=False)
+    os.replace(temp_file_path, manifest_path)
+
+
+def _get_annots_in_pages(path, page_numbers, kwargs, profile: bool = False):
+    """Worker of PdfHelper._get_annots: open `path` and collect the annots
+    of `page_numbers`. Return them with the stats of their stages when
+    `profile`, else None."""
+    profiler = StageProfiler() if profile else NULL_PROFILER
+    annots = list(
+        PdfHelper(path)._get_annots_in_pages(page_numbers, profiler=profiler, **kwargs)
+    )
+    return annots, profiler.stats() if profile else None
+
+
+def _get_page_lines(path, page_numbers, max_length):
+    """Worker of PdfHelper.extract_toc_from_text: open `path` and read the
+    lines of `page_numbers`."""
+    return PdfHelper(path)._get_page_lines(page_numbers, max_length)
+
+
+def _is_bold(span):
+    # OCR and embedded fonts often only say it in their name
+    return bool(span["flags"] & fitz.TEXT_FONT_BOLD) or any(
+        weight in span["font"].lower() for weight in ("bold", "black", "heavy")
+    )
+
+
+def _is_ocr_pending(annot):
+    return isinstance(annot["text"], Future) and not annot["text"].done()
+
+
+def _resolve_ocr_text(annot, ocr_pool: OCRPool):
+    if isinstance(annot["text"], Future):
+        if not annot["text"].done():
+            # it may be waiting in a partial batch
+            ocr_pool.flush()
+        annot["text"] = annot["text"].result()
+    return annot
+
+
+def iter_xfdf_annot_tags(annot_file: str, namespace: str):
+    """
+    Yield the annotation tags in the annots tag of `annot_file` one at a time,
+    parsing the file as they are consumed. Each tag is cleared once the next one
+    is asked for, so only one is in memory at a time.
+    """
+    depth = 0
+    annots = None
+    found = False  # the annots tag has children
+    for event, elem in ET.iterparse(annot_file, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 2 and elem.tag == f"{namespace}annots" and annots is None:
+                annots = elem
+            continue
+        depth -= 1
+        if depth == 1 and elem is annots:
+            break
+        if depth == 2 and annots is not None:
+            found = True
+            yield elem
+            elem.clear()
+            annots.remove(elem)
+    if not found:
+        raise Exception("Wrong Format")
+
 
 class AnnotTagHandler(object):
-    def __init__(self, annot_tag, namespace, pdf_handler):
+    def __init__(self, annot_tag, namespace, pdf_handler, page=None):
         self.annot_tag = annot_tag
         self.namespace = namespace
         self.attrib = self.annot_tag.attrib
-        self.page = pdf_handler.doc.load_page(int(self.attrib.get("page")))
+        # `page` saves loading it again when it's already at hand
+        self.page = page or pdf_handler.doc.load_page(int(self.attrib.get("page")))
         self.pymupdf_to_xfdf_mappings = pdf_handler.pymupdf_to_xfdf_mappings
         self.page_height = self.page.rect.height
 
@@ -564,17 +1076,7 @@ class AnnotTagHandler(object):
     def coords(self):
         coords_str = self.attrib.get("coords")
         if coords_str:
-            coords_list = list(map(float, coords_str.split(",")))
-            vertices = []
-            for i in range(0, len(coords_list), 2):
-                x = coords_list[i]
-                y = self.page_height - coords_list[i + 1]
-                vertices.append((x, y))
-
-            quad_count = int(len(vertices) / 4)
-            return [
-                fitz.Quad(vertices[i * 4 : i * 4 + 4]).rect for i in range(quad_count)
-            ]
+            return quad_rects(parse_xfdf_points(coords_str, self.page_height))
         return None
 
     @property
@@ -582,10 +1084,10 @@ class AnnotTagHandler(object):
         if self.attrib.get("content"):
             return self.attrib.get("content")
         contents = self.annot_tag.find(f"{self.namespace}contents")
-        if isinstance(contents, ET.Element):
+        if contents is not None:
             return contents.text
         contents_richtext = self.annot_tag.find(f"{self.namespace}contents-richtext")
-        if isinstance(contents_richtext, ET.Element):
+        if contents_richtext is not None:
             text_parts = [
                 part for part in contents_richtext.itertext() if part.strip() != ""
             ]
@@ -597,15 +1099,9 @@ class AnnotTagHandler(object):
         gestures = self.annot_tag.find(f"{self.namespace}inklist").findall(
             f"{self.namespace}gesture"
         )
-        ink_list = []
-        for gesture in gestures:
-            points = gesture.text.split(";")
-            coords = [
-                (float(p.split(",")[0]), self.page_height - float(p.split(",")[1]))
-                for p in points
-            ]
-            ink_list.append(coords)
-        return ink_list
+        return [
+            parse_xfdf_points(gesture.text, self.page_height) for gesture in gestures
+        ]
 
     def get_line_ends_point(self, type):
         x, y = self.attrib.get(type).split(",")
@@ -645,7 +1141,7 @@ class AnnotTagHandler(object):
         return color
 
     def has_popup(self):
-        return isinstance(self.popup, ET.Element)
+        return self.popup is not None
 
     @property
     def popup(self):
@@ -720,32 +1216,20 @@ class AnnotationHandler(object):
         )
 
     def xfdf_coords_string(self):
-        result = []
-        vertices = self.annot.vertices
-        for x, y in vertices:
-            result.append(x)
-            result.append(self.page_height - y)
-        return ",".join(map(str, result))
+        return ",".join(xfdf_point_strings(self.annot.vertices, self.page_height))
 
     def line_end_points(self):
-        result = []
-        vertices = self.annot.vertices
-        for x, y in vertices:
-            result.append((x, self.page_height - y))
-        return [f"{x},{y}" for x, y in result]
+        return xfdf_point_strings(self.annot.vertices, self.page_height)
 
     def xfdf_ink_gesture_string_list(self) -> list[str]:
-        result = []
-        vertices = self.annot.vertices
-        for sublist in vertices:
-            gesture_points = []
-            for x, y in sublist:
-                gesture_points.append(f"{x},{self.page_height - y}")
-            gesture_text = ";".join(gesture_points)
-            result.append(gesture_text)
-        return result
-
-    def save_pic(self, picture_path, zoom):
+        return [
+            ";".join(xfdf_point_strings(stroke, self.page_height))
+            for stroke in self.annot.vertices
+        ]
+
+    def save_pic(self, picture_path, zoom, page_renderer=None, write: bool = True):
+        """Render the area of the annot into a Picture kept in memory, and write
+        it to `picture_path` if `write`. Return None when there is no picture."""
         if self.type_id in [SQUARE, INK, LINE]:
             export_picture_with_annot = (
                 False if self.type_id == SQUARE else True
@@ -757,7 +1241,7 @@ class AnnotationHandler(object):
             # Check if the rectangle is valid (width and height must be greater than 0)
             if clip_rect.width <= 0 or clip_rect.height <= 0:
                 print(f"Warning: Invalid rectangle size {clip_rect}, skipping image saving")
-                return 0
+                return None
             
             # Ensure the rectangle is within the page boundaries
             page_rect = self.page.rect
@@ -765,46 +1249,184 @@ class AnnotationHandler(object):
             
             if clip_rect.is_empty:
                 print(f"Warning: Rectangle is out of page bounds, skipping image saving")
-                return 0
+                return None
                 
-            pix = self.page.get_pixmap(
+            page_renderer = page_renderer or PageRenderer(self.page)
+            pix = page_renderer.get_pixmap(
                 annots=export_picture_with_annot,
                 clip=clip_rect,
                 matrix=fitz.Matrix(zoom, zoom),  # zoom image
             )
-            pix.save(picture_path)
-            return 1
-        return 0
+            picture = Picture(picture_path, content=pix.tobytes("png"))
+            if write:
+                picture.save()
+            return picture
+        return None
 
-    def get_text(self, wordlist, picture_path, ocr_service, ocr_language):
+    @property
+    def has_text(self):
+        return self.type_id in TEXT_EXTRACTION_TYPES
+
+    def get_text(self, page_words, picture: Picture = None, ocr_pool: OCRPool = None):
+        """Return the text under the annot. When there is none, OCR `picture`
+        on `ocr_pool` and return the Future of its text."""
         text = ""
-        if self.type_id in [
-            SQUARE,
-            INK,
-            LINE,
-            HIGHLIGHT,
-            UNDERLINE,
-            SQUIGGLY,
-            STRIKEOUT,
-        ]:
-            text = self._extract_rectangle_list_text(wordlist)
+        if self.has_text:
+            text = self._extract_rectangle_list_text(page_words)
         if text:
             return text
-        elif picture_path and ocr_service:
-            return Picture(picture_path).get_ocr_result(
-                ocr_service=ocr_service, language=ocr_language
-            )
+        elif picture and ocr_pool:
+            return ocr_pool.submit(picture)
         return ""
 
-    def _extract_rectangle_list_text(self, wordlist):
+    def _extract_rectangle_list_text(self, page_words):
         sentences = []
         for rect in self.rect_list:
-            words = [w for w in wordlist if fitz.Rect(w[:4]).intersects(rect)]
+            words = page_words.query(rect)
             sentence = " ".join(w[4] for w in words).strip()
             sentences.append(sentence)
         return " ".join(sentences)
 
 
+class WordIndex(object):
+    """
+    Words of a page sorted by ascending y, then x, with their boxes kept in
+    flat arrays. A rectangle query only scans the y-band of words that can
+    reach the rectangle instead of the whole page.
+    """
+
+    def __init__(self, word_list):
+        # Empty and infinite boxes never intersect anything, drop them up front.
+        self.words = sorted(
+            [
+                w
+                for w in word_list
+                if not fitz.Rect(w[:4]).is_empty and not fitz.Rect(w[:4]).is_infinite
+            ],
+            key=lambda w: (w[3], w[0]),
+        )
+        self.x0 = array("d", (w[0] for w in self.words))
+        self.y0 = array("d", (w[1] for w in self.words))
+        self.x1 = array("d", (w[2] for w in self.words))
+        self.y1 = array("d", (w[3] for w in self.words))
+        self.max_height = max(
+            (y1 - y0 for y0, y1 in zip(self.y0, self.y1)), default=0.0
+        )
+
+    def __len__(self):
+        return len(self.words)
+
+    def query(self, rect) -> list:
+        """Return the words intersecting `rect`, in index order.
+
+        Same result as filtering the sorted word list with
+        `fitz.Rect(w[:4]).intersects(rect)`.
+        """
+        rect = fitz.Rect(rect)
+        if rect.is_empty or rect.is_infinite:
+            return []
+        # A word reaches the rect only if y1 > rect.y0 and y0 < rect.y1.
+        # y0 >= y1 - max_height bounds the second condition on the sorted y1.
+        start = bisect_right(self.y1, rect.y0)
+        end = bisect_left(self.y1, rect.y1 + self.max_height + 1)
+        x0, y0, x1 = self.x0, self.y0, self.x1
+        return [
+            self.words[i]
+            for i in range(start, end)
+            if x0[i] < rect.x1 and rect.x0 < x1[i] and y0[i] < rect.y1
+        ]
+
+
+class PageWords(object):
+    """
+    Words of a page, extracted on first query from one shared TextPage.
+
+    With `clip_rects`, only the words touching those rects are kept before
+    sorting and indexing. Every query must then be one of `clip_rects`.
+    """
+
+    # clip when at most this many annots need text and they cover at most this
+    # fraction of the page
+    clip_max_annots = 2
+    clip_max_area = 0.25
+
+    def __init__(self, page, clip_rects=None, profiler=NULL_PROFILER):
+        self.page = page
+        self.clip_rects = clip_rects
+        self.profiler = profiler
+        self._textpage = None
+        self._word_index = None
+
+    @classmethod
+    def for_annots(cls, page, annots, profiler=NULL_PROFILER):
+        handlers = [AnnotationHandler(annot) for annot in annots]
+        rects = [rect for h in handlers if h.has_text for rect in h.rect_list]
+        text_annot_count = len([h for h in handlers if h.has_text])
+        if text_annot_count <= cls.clip_max_annots and sum(
+            abs(rect) for rect in rects
+        ) <= cls.clip_max_area * abs(page.rect):
+            return cls(page, clip_rects=rects, profiler=profiler)
+        return cls(page, profiler=profiler)
+
+    @property
+    def textpage(self):
+        if self._textpage is None:
+            self._textpage = self.page.get_textpage(flags=fitz.TEXTFLAGS_WORDS)
+        return self._textpage
+
+    @property
+    def word_index(self):
+        if self._word_index is None:
+            with self.profiler.stage("words", page=self.page.number + 1):
+                self._word_index = self._build_word_index()
+        return self._word_index
+
+    def _build_word_index(self):
+        word_list = self.page.get_text("words", textpage=self.textpage)
+        if self.clip_rects is not None:
+            clips = [
+                fitz.Rect(r)
+                for r in self.clip_rects
+                if not fitz.Rect(r).is_empty and not fitz.Rect(r).is_infinite
+            ]
+            word_list = [
+                w
+                for w in word_list
+                if any(
+                    w[0] < r.x1 and r.x0 < w[2] and w[1] < r.y1 and r.y0 < w[3]
+                    for r in clips
+                )
+            ]
+        return WordIndex(word_list)
+
+    def query(self, rect) -> list:
+        return self.word_index.query(rect)
+
+
+class PageRenderer(object):
+    """
+    Rasterise clips of a page from display lists built on first use, one with
+    and one without annots, so the page content is interpreted once per setting
+    instead of once per clip.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self._display_lists = {}
+
+    def display_list(self, annots: bool = True):
+        annots = bool(annots)
+        if annots not in self._display_lists:
+            self._display_lists[annots] = self.page.get_displaylist(annots=annots)
+        return self._display_lists[annots]
+
+    def get_pixmap(self, clip, matrix=fitz.Identity, annots: bool = True):
+        # same defaults as Page.get_pixmap
+        return self.display_list(annots).get_pixmap(
+            matrix=matrix, colorspace=fitz.csRGB, alpha=False, clip=clip
+        )
+
+
 class RGB(object):
     def __init__(self, value):
         self.value = value
@@ -852,19 +1474,42 @@ def pic2pdf(image_dir: str, pdf_path: str):
     doc.close()
 
 
+def compile_template(text: str, module_directory: str = ""):
+    """
+    Compile a Mako template from `text`.
+
+    With `module_directory`, the template is stored there under a hash of its
+    text and Mako keeps the generated module next to it, so later runs with the
+    same template load the module instead of compiling again.
+    """
+    from mako.template import Template  # only export-annot needs Mako
+
+    if not module_directory:
+        return Template(text)
+    os.makedirs(module_directory, exist_ok=True)
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    template_path = os.path.join(module_directory, f"{key}.mako")
+    if not os.path.exists(template_path):
+        temp_file_path = f"{template_path}.{os.getpid()}"
+        with open(temp_file_path, "w", encoding="utf-8") as data:
+            data.write(text)
+        os.replace(temp_file_path, template_path)
+    return Template(
+        filename=template_path,
+        uri=f"{key}.mako",
+        module_directory=module_directory,
+        input_encoding="utf-8",
+    )
+
+
+_bib_index = None
+
+
 def find_unique_bib_key(bib_path_list, val):
-    keys = []
-    for bib_path in bib_path_list:
-        with open(bib_path, "r", encoding="utf-8") as bib_file:
-            bib_content = bib_file.read()
-
-        for entry in bib_content.split("\n\n"):
-            if val in entry:
-                key = entry.split("{")[1].split(",")[0].strip()
-                keys.append(key)
-        if len(keys) == 1:
-            return keys[0]
-    return ""
+    global _bib_index
+    if _bib_index is None:
+        _bib_index = BibIndex()
+    return _bib_index.find_unique_key(bib_path_list, val)
 
 
 def images_to_open(file_names: list):
@@ -4,11 +4,17 @@
 Some useful functions to process a PDF file.
 """
 import argparse
+import contextlib
+import functools
+import io
+import os
+import re
 import sys
 
-
 from pdf_handler import PdfHelper
 from picture_handler import help_text_for_ocr_language, help_text_for_ocr_service
+from profile_handler import NULL_PROFILER, StageProfiler
+from toc_handler import HeadingDetector
 from format_annots_template import (
     toc_item_default_format,
     annot_item_default_format,
@@ -21,10 +27,28 @@ def create_argparser():
 
     p.add_argument(
         "INFILE",
-        help="PDF file to process",
-        type=argparse.FileType("rb"),
+        help="PDF file to process. A folder processes every PDF file in it, recursively; - reads the files from stdin, one per line.",
+    )
+    p.add_argument(
+        "--infile",
+        help="Another PDF file or folder to process along with INFILE. Can be given more than once.",
+        action="append",
+        default=[],
+    )
+    p.add_argument(
+        "--file-jobs",
+        help="Number of processes to work on the files with, when there are more than one.",
+        type=int,
+        default=1,
+        dest="file_jobs",
+    )
+    p.add_argument("--version", "-v", action="version", version="2.6.0")
+    p.add_argument(
+        "--compact-after",
+        help="Changes saved back to INFILE are appended as incremental updates. Once INFILE has this many updates, it is rewritten and compacted instead. 0 always rewrites.",
+        type=int,
+        default=20,
     )
-    p.add_argument("--version", "-v", action="version", version="2.5.1")
 
     # export-toc
     parser_export_toc = subparsers.add_parser(
@@ -48,6 +72,45 @@ def create_argparser():
         "--target", help="Target PDF file or folder. Defaults to updating INFILE."
     )
 
+    # extract-toc
+    parser_extract_toc = subparsers.add_parser(
+        "extract-toc",
+        help="Detect the headings in the text of the PDF, by pattern and font, and save them as its TOC.",
+    )
+    parser_extract_toc.add_argument(
+        "--target", help="Target PDF file or folder. Defaults to updating INFILE."
+    )
+    parser_extract_toc.add_argument(
+        "--overwrite",
+        help="Replace the TOC the PDF already has. Without it, a PDF with a TOC is left as it is.",
+        action="store_true",
+    )
+    parser_extract_toc.add_argument(
+        "--jobs",
+        "-j",
+        help="Number of processes to read the pages with.",
+        type=int,
+        default=1,
+    )
+    parser_extract_toc.add_argument(
+        "--heading",
+        help="LEVEL=REGEX: lines matching REGEX at their start are headings of LEVEL. Can be given more than once, the first matching one wins. Replaces the default patterns, defined in `toc_handler.DEFAULT_HEADING_PATTERNS`.",
+        type=heading_pattern,
+        action="append",
+    )
+    parser_extract_toc.add_argument(
+        "--min-score",
+        help="Score a line needs to be a heading: 1 for matching a heading pattern, 1 for a font larger than the body text and 1 more for a much larger one, 1 for bold.",
+        type=int,
+        default=2,
+    )
+    parser_extract_toc.add_argument(
+        "--max-per-page",
+        help="Pages with more headings than this are skipped, like the printed contents.",
+        type=int,
+        default=4,
+    )
+
     # delete-annot
     parser_delete_annot = subparsers.add_parser(
         "delete-annot", help="Delete annotations from the PDF."
@@ -98,6 +161,17 @@ def create_argparser():
     )
     parser_export_annot.add_argument("--ocr-service", help=help_text_for_ocr_service)
     parser_export_annot.add_argument("--ocr-language", help=help_text_for_ocr_language)
+    parser_export_annot.add_argument(
+        "--ocr-max-in-flight",
+        help="Maximum number of OCR requests running at the same time. Extraction goes on while they are outstanding.",
+        type=int,
+        default=4,
+    )
+    parser_export_annot.add_argument(
+        "--no-ocr-cache",
+        help="Always send images to the OCR service instead of reusing the results cached by earlier runs.",
+        action="store_true",
+    )
     parser_export_annot.add_argument(
         "--image-zoom", help="Image zoom factor", default=4
     )
@@ -116,6 +190,18 @@ def create_argparser():
         help="Customize the format of the annotation item using the mako template syntax. The default template is defined in `format_annots_template.annot_item_default_format`. The template supports the following variables: type, page, comment, text, annot_number, annot_id, height, color, pic_path, bib_key, and pdf_path. For detailed usage, please refer to the Readme.",
         default=annot_item_default_format,
     )
+    parser_export_annot.add_argument(
+        "--jobs",
+        "-j",
+        help="Number of processes to extract annotations with. Pages are split between them; the output is the same as with one process.",
+        type=int,
+        default=1,
+    )
+    parser_export_annot.add_argument(
+        "--template-cache-dir",
+        help="Dir to cache the compiled templates in, so later runs with the same templates skip compiling them. When omitted, templates are compiled on every run.",
+        default="",
+    )
     parser_export_annot.add_argument(
         "--bib-path",
         nargs="+",
@@ -132,6 +218,26 @@ def create_argparser():
         help="Specify the end of creation date range for exporting annotations in the format 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'.",
         default="",
     )
+    parser_export_annot.add_argument(
+        "--incremental",
+        help="Reuse the text, pictures and OCR results of the last run for annotations that haven't changed since. The results are kept in a manifest file.",
+        action="store_true",
+    )
+    parser_export_annot.add_argument(
+        "--manifest",
+        help="Manifest file for --incremental. Defaults to {INFILE name}.annots.json in the folder where INFILE is located.",
+        default="",
+    )
+    parser_export_annot.add_argument(
+        "--profile",
+        help="Write the wall time, call count and bytes of each stage (page loading, text extraction, picture rendering, OCR, templates, ...), per page and in total, to this JSON file or folder.",
+        default="",
+    )
+    parser_export_annot.add_argument(
+        "--cprofile",
+        help="Dump cProfile statistics of the run to this file or folder, to be read with pstats or snakeviz.",
+        default="",
+    )
     parser_export_annot.add_argument(
         "--run-test",
         help="Run a test instead of extracting full annotations. Useful for checking output format and image quality",
@@ -168,7 +274,8 @@ def create_argparser():
         "page-label-to-number", help="Convert page label to page number."
     )
     parser_page_label_to_number.add_argument(
-        "PAGE_LABEL", help="Page label to convert."
+        "PAGE_LABEL",
+        help="Page label to convert. - converts every line of stdin, printing one number per line.",
     )
 
     # page-number-to-label
@@ -176,17 +283,149 @@ def create_argparser():
         "page-number-to-label", help="Convert page number to page label."
     )
     parser_page_number_to_label.add_argument(
-        "PAGE_NUMBER", help="Page number to convert."
+        "PAGE_NUMBER",
+        help="Page number to convert. - converts every line of stdin, printing one label per line.",
+    )
+
+    # serve
+    parser_serve = subparsers.add_parser(
+        "serve",
+        help="Answer requests on a Unix socket, keeping the PDF files open between them. INFILE is the path of the socket.",
+    )
+    parser_serve.add_argument(
+        "--max-docs",
+        help="Number of PDF files to keep open. The least recently used one is closed first.",
+        type=int,
+        default=8,
     )
 
     return p
 
 
-def main(args):
-    path = (
-        sys.stdin.read().strip() if args.INFILE.name == "<stdin>" else args.INFILE.name
-    )
-    pdf = PdfHelper(path)
+def heading_pattern(value: str):
+    level, _, pattern = value.partition("=")
+    if not level.strip().isdigit() or int(level) < 1 or not pattern:
+        raise argparse.ArgumentTypeError(f"expected LEVEL=REGEX, got {value!r}")
+    try:
+        return int(level), re.compile(pattern)
+    except re.error as e:
+        raise argparse.ArgumentTypeError(f"invalid regex {pattern!r}: {e}")
+
+
+# output arguments of each command, and whether they may be a folder. With
+# more than one file, they must be omitted or a folder, so that every file
+# gets its own output (see PdfHelper._get_target_file_path)
+per_file_outputs = {
+    "export-toc": [("TOC_PATH", True)],
+    "import-toc": [("target", True)],
+    "extract-toc": [("target", True)],
+    "delete-annot": [("target", True)],
+    "export-xfdf-annot": [("XFDF_ANNOT_PATH", True)],
+    "import-xfdf-annot": [("target", True)],
+    "export-annot": [
+        ("ANNOT_PATH", False),
+        ("manifest", True),
+        ("profile", True),
+        ("cprofile", True),
+    ],
+    "export-info": [("INFO_PATH", True)],
+    "import-info": [("target", True)],
+}
+
+
+def get_infiles(args, parser):
+    paths = []
+    for path in [args.INFILE] + args.infile:
+        if path == "-":
+            paths.extend(line.strip() for line in sys.stdin if line.strip())
+        else:
+            paths.append(path)
+    infiles = []
+    for path in paths:
+        if not os.path.isdir(path):
+            if not os.access(path, os.R_OK):
+                parser.error(f"argument INFILE: can't open '{path}'")
+            infiles.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            infiles.extend(
+                os.path.join(root, f)
+                for f in sorted(files)
+                if os.path.splitext(f)[1].lower() == ".pdf"
+            )
+    return infiles
+
+
+def main(args, parser):
+    if args.command == "serve":
+        from server_handler import serve
+
+        serve(args.INFILE, max_docs=args.max_docs, compact_after=args.compact_after)
+        return
+    pages_from_stdin = "-" in [
+        getattr(args, "PAGE_LABEL", None),
+        getattr(args, "PAGE_NUMBER", None),
+    ]
+    if pages_from_stdin and "-" in [args.INFILE] + args.infile:
+        raise Exception("stdin can't give both the files and the pages")
+    infiles = get_infiles(args, parser)
+    if not infiles:
+        raise Exception("No PDF file Found!")
+    if pages_from_stdin and len(infiles) > 1:
+        raise Exception("Pages can only be read from stdin for one file")
+    if len(infiles) == 1:
+        run(args, infiles[0])
+        return
+    for dest, folder in per_file_outputs.get(args.command, []):
+        value = getattr(args, dest)
+        if value and (not folder or os.path.splitext(value)[-1]):
+            raise Exception(
+                f"{dest} would be the same for all {len(infiles)} files, "
+                + ("use a folder instead" if folder else "omit it")
+            )
+    failed = []
+    with contextlib.ExitStack() as stack:
+        if args.file_jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            executor = stack.enter_context(
+                ProcessPoolExecutor(max_workers=args.file_jobs)
+            )
+            results = executor.map(functools.partial(run_isolated, args), infiles)
+        else:
+            results = map(functools.partial(run_isolated, args), infiles)
+        # print what each file outputs in the order of the files
+        for path, output, error in results:
+            sys.stdout.write(output)
+            sys.stdout.flush()
+            if error:
+                print(f"{path}: {error}", file=sys.stderr)
+                failed.append(path)
+    print(
+        f"{len(infiles) - len(failed)} of {len(infiles)} files processed, {len(failed)} failed",
+        file=sys.stderr,
+    )
+    if failed:
+        sys.exit(1)
+
+
+def run_isolated(args, path):
+    """Run the command on one of many files.
+
+    Return (path, output, error), so that one broken file doesn't stop the others.
+    """
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            run(args, path)
+    except Exception as e:
+        return path, output.getvalue(), f"{type(e).__name__}: {e}"
+    return path, output.getvalue(), ""
+
+
+def run(args, path):
+    pdf = PdfHelper(path, compact_after=args.compact_after)
 
     if args.command == "export-toc":
         pdf.export_toc(args.TOC_PATH)
@@ -197,6 +436,17 @@ def main(args):
             pdf.import_toc_from_url(url=toc, target_pdf=target)
         else:
             pdf.import_toc_from_file(toc_path=toc, target_pdf=target)
+    elif args.command == "extract-toc":
+        pdf.extract_toc_from_text(
+            target_pdf=args.target,
+            jobs=args.jobs,
+            heading_detector=HeadingDetector(
+                patterns=args.heading,
+                min_score=args.min_score,
+                max_per_page=args.max_per_page,
+            ),
+            overwrite=args.overwrite,
+        )
     elif args.command == "delete-annot":
         pdf.delete_annots(target_path=args.target)
     elif args.command == "export-xfdf-annot":
@@ -206,31 +456,59 @@ def main(args):
             annot_file=args.XFDF_ANNOT_PATH, target_pdf=args.target, save_pdf=True
         )
     elif args.command == "export-annot":
-        pdf.format_annots(
-            output_file=args.ANNOT_PATH,
-            annot_image_dir=args.annot_image_dir,
-            ocr_service=args.ocr_service,
-            ocr_language=args.ocr_language,
-            zoom=args.image_zoom,
-            with_toc=args.with_toc,
-            toc_list_item_format=args.toc_list_item_format,
-            annot_list_item_format=args.annot_list_item_format,
-            bib_file_list=args.bib_path,
-            creation_start_date=args.creation_start,
-            creation_end_date=args.creation_end,
-            run_test=args.run_test,
+        profiler = (
+            StageProfiler(cprofile=bool(args.cprofile))
+            if args.profile or args.cprofile
+            else NULL_PROFILER
         )
+        with profiler.run():
+            pdf.format_annots(
+                output_file=args.ANNOT_PATH,
+                annot_image_dir=args.annot_image_dir,
+                ocr_service=args.ocr_service,
+                ocr_language=args.ocr_language,
+                zoom=args.image_zoom,
+                with_toc=args.with_toc,
+                toc_list_item_format=args.toc_list_item_format,
+                annot_list_item_format=args.annot_list_item_format,
+                bib_file_list=args.bib_path,
+                creation_start_date=args.creation_start,
+                creation_end_date=args.creation_end,
+                run_test=args.run_test,
+                template_cache_dir=args.template_cache_dir,
+                jobs=args.jobs,
+                ocr_max_in_flight=args.ocr_max_in_flight,
+                ocr_cache=not args.no_ocr_cache,
+                incremental=args.incremental,
+                manifest_path=args.manifest,
+                profiler=profiler,
+            )
+        if args.profile:
+            profiler.save(
+                pdf._get_target_file_path(args.profile, "profile.json"),
+                file=os.path.abspath(path),
+                jobs=args.jobs,
+                ocr_service=args.ocr_service or "",
+            )
+        if args.cprofile:
+            profiler.save_cprofile(pdf._get_target_file_path(args.cprofile, "prof"))
     elif args.command == "export-info":
         pdf.export_info(info_file=args.INFO_PATH)
     elif args.command == "import-info":
         pdf.import_info(info_file=args.INFO_PATH, target_pdf=args.target, save_pdf=True)
     elif args.command == "page-label-to-number":
-        pdf.get_page_number(label=args.PAGE_LABEL)
+        if args.PAGE_LABEL == "-":
+            pdf.get_page_numbers(labels=(line.strip() for line in sys.stdin))
+        else:
+            pdf.get_page_number(label=args.PAGE_LABEL)
     elif args.command == "page-number-to-label":
-        pdf.get_page_label(number=args.PAGE_NUMBER)
+        if args.PAGE_NUMBER == "-":
+            pdf.get_page_labels(numbers=(line.strip() for line in sys.stdin))
+        else:
+            pdf.get_page_label(number=args.PAGE_NUMBER)
 
 
 if __name__ == "__main__":
     parser = create_argparser()
     args = parser.parse_args()
-    main(args)
+    main(args, parser)
@@ -1,59 +1,196 @@
 #!/usr/bin/env python3
 
-import requests
 import json
 import base64
 import configparser
 import os
 import re
 import argparse
+import functools
+import hashlib
 import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from profile_handler import NULL_PROFILER
 
 help_text_for_ocr_service = "The OCR Sevice to use, now supported: paddle, ocrspace"
 help_text_for_ocr_language = "The language to use for ocr: zh-Hans, zh-Hant, en, ja"
 
 
 class Picture(object):
-    def __init__(self, path):
+    """
+    An image at `path`. With `content`, the PNG bytes are kept in memory and
+    the file is only written by `save`.
+    """
+
+    def __init__(self, path, content: bytes = None):
         self.path = path
+        self._content = content
 
-    def get_ocr_result(self, language, ocr_service="paddle"):
-        ocr = OCRHandler(source_file=self, ocr_service=ocr_service)
+    def get_ocr_result(self, language, ocr_service="paddle", ocr_client=None):
+        if ocr_client is None:
+            with OCRClient(ocr_service, use_cache=False) as ocr_client:
+                return self.get_ocr_result(language, ocr_service, ocr_client)
+        ocr = OCRHandler(source_file=self, ocr_client=ocr_client)
         ocr_result = ocr.get_ocr_result(language)
         return ocr_result
 
     def _to_base64(self):
-        with open(self.path, "rb") as f:
-            data = f.read()
-            return base64.b64encode(data).decode("utf8")
+        return base64.b64encode(self.content).decode("utf8")
+
+    @property
+    def content(self):
+        if self._content is None:
+            with open(self.path, "rb") as f:
+                self._content = f.read()
+        return self._content
+
+    def save(self):
+        with open(self.path, "wb") as f:
+            f.write(self.content)
 
     @property
     def file_size(self):
+        if self._content is not None:
+            return len(self._content)
         return os.path.getsize(self.path)
 
 
+@functools.lru_cache(maxsize=None)
+def read_ocr_config():
+    ocr_config = configparser.ConfigParser()
+    ocr_config_ini = os.path.join(
+        os.path.split(os.path.realpath(__file__))[0], "ocr_config.ini"
+    )
+    ocr_config.read(ocr_config_ini)
+    return ocr_config
+
+
+class OCRClient(object):
+    """
+    What the OCR requests of a run share: the parsed ocr_config.ini, one
+    keep-alive requests.Session for the service, the connect/read timeouts,
+    the rate limiter and the result cache. Create it once and pass it to every
+    Picture.get_ocr_result.
+
+    Timeouts are read from `connect_timeout` and `read_timeout` (seconds) in
+    the service section of ocr_config.ini. For paddle, `batch_size` images up
+    to `batch_size_limit` in total can be sent in one request.
+    """
+
+    supported_services = ["paddle", "ocrspace"]
+
+    def __init__(self, ocr_service, use_cache: bool = True, max_connections: int = 4):
+        if ocr_service not in self.supported_services:
+            raise Exception(f"{ocr_service} is not supported. ")
+        self.ocr_service = ocr_service
+        self.ocr_config = read_ocr_config()
+        self.timeout = (
+            self.ocr_config.getfloat(ocr_service, "connect_timeout", fallback=10),
+            self.ocr_config.getfloat(ocr_service, "read_timeout", fallback=120),
+        )
+        import requests  # only runs with OCR, keeps it out of the other commands
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(1, max_connections)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        rate_limit = self.ocr_config.getfloat(ocr_service, "rate_limit", fallback=0)
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit > 0 else None
+        self.ocr_cache = OCRCache() if use_cache else None
+        self.batch_size = (
+            self.ocr_config.getint("paddle", "batch_size", fallback=1)
+            if ocr_service == "paddle"
+            else 1
+        )
+        self.batch_size_limit = parse_size(
+            self.ocr_config.get(ocr_service, "batch_size_limit", fallback="4MB")
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def post(self, **kwargs):
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+        return self.session.post(timeout=self.timeout, **kwargs)
+
+    def get_ocr_results_by_paddle(self, pictures, language):
+        """OCR `pictures` with one paddle request, return their texts in order.
+        Cached pictures are not sent."""
+        keys = [
+            self.ocr_cache.key(x.content, self.ocr_service, language)
+            if self.ocr_cache
+            else None
+            for x in pictures
+        ]
+        texts = [self.ocr_cache.get(key) if key else None for key in keys]
+        missing = [i for i, text in enumerate(texts) if text is None]
+        if missing:
+            data = {"images": [pictures[i]._to_base64() for i in missing]}
+            headers = {"Content-type": "application/json"}
+            res = self.post(
+                url=self.ocr_config["paddle"]["url"],
+                headers=headers,
+                data=json.dumps(data),
+            )
+            results = res.json()["results"]
+            if len(results) != len(missing):
+                raise Exception(
+                    f"Expected {len(missing)} OCR results, got {len(results)}."
+                )
+            for i, result in zip(missing, results):
+                texts[i] = "\n".join([x["text"] for x in result["data"]])
+                if keys[i]:
+                    self.ocr_cache.put(keys[i], texts[i])
+        return texts
+
+    def close(self):
+        self.session.close()
+        if self.ocr_cache:
+            if self.ocr_cache.hits or self.ocr_cache.misses:
+                print(
+                    f"OCR cache: {self.ocr_cache.hits} hits, {self.ocr_cache.misses} misses",
+                    file=sys.stderr,
+                )
+            self.ocr_cache.close()
+
+
 class OCRHandler(object):
-    def __init__(self, source_file, ocr_service):
+    def __init__(self, source_file, ocr_client):
         self.source_file = source_file
         self.source_file_path = source_file.path
-        self.ocr_config = configparser.ConfigParser()
-        ocr_config_ini = os.path.join(
-            os.path.split(os.path.realpath(__file__))[0], "ocr_config.ini"
-        )
-        self.ocr_config.read(ocr_config_ini)
+        self.ocr_client = ocr_client
+        self.ocr_service = ocr_client.ocr_service
+        self.ocr_cache = ocr_client.ocr_cache
+        self.ocr_config = ocr_client.ocr_config
         self.ocr_service_functions = {
             "paddle": self.get_ocr_result_by_paddle,
             "ocrspace": self.get_ocr_result_by_ocrspace,
         }
-        if ocr_service in self.ocr_service_functions.keys():
-            self.get_ocr_result = self.ocr_service_functions[ocr_service]
-        else:
-            raise Exception(f"{ocr_service} is not supported. ")
+        self.get_ocr_result_by_service = self.ocr_service_functions[self.ocr_service]
+
+    def get_ocr_result(self, language):
+        if not self.ocr_cache:
+            return self.get_ocr_result_by_service(language)
+        key = self.ocr_cache.key(self.source_file.content, self.ocr_service, language)
+        text = self.ocr_cache.get(key)
+        if text is None:
+            text = self.get_ocr_result_by_service(language)
+            self.ocr_cache.put(key, text)
+        return text
 
     def get_ocr_result_by_paddle(self, language):
         data = {"images": [self.source_file._to_base64()]}
         headers = {"Content-type": "application/json"}
-        res = requests.post(
+        res = self.ocr_client.post(
             url=self.ocr_config["paddle"]["url"], headers=headers, data=json.dumps(data)
         )
         text = [x["text"] for x in res.json()["results"][0]["data"]]
@@ -73,12 +210,16 @@ class OCRHandler(object):
                     "apikey": self.ocr_config["ocrspace"]["key"],
                     "language": language_mapping.get(language),
                 }
-                with (open(self.source_file_path, "rb")) as f:
-                    res = requests.post(
-                        url=self.ocr_config["ocrspace"]["url"],
-                        files={"filename": f},
-                        data=data,
-                    )
+                res = self.ocr_client.post(
+                    url=self.ocr_config["ocrspace"]["url"],
+                    files={
+                        "filename": (
+                            os.path.basename(self.source_file_path),
+                            self.source_file.content,
+                        )
+                    },
+                    data=data,
+                )
                 raw = res.json()
                 if type(raw) == str:
                     raise Exception(raw)
@@ -102,6 +243,195 @@ class OCRHandler(object):
             return False
 
 
+class OCRCache(object):
+    """
+    SQLite cache of OCR results, keyed by a hash of the image bytes, the
+    service and the language, so unchanged images are never sent twice.
+
+    Entries unused for `max_age` days are dropped, and past `max_entries` the
+    least recently used ones go. Both can be set in the [cache] section of
+    ocr_config.ini, along with the database `path`. Empty results and errors
+    are not cached.
+    """
+
+    def __init__(self, path: str = "", max_entries: int = 0, max_age: float = 0):
+        config = read_ocr_config()
+        self.path = path or os.path.expanduser(
+            config.get(
+                "cache",
+                "path",
+                fallback=os.path.join(
+                    os.environ.get("XDG_CACHE_HOME", "~/.cache"),
+                    "pdfhelper",
+                    "ocr_cache.sqlite3",
+                ),
+            )
+        )
+        self.max_entries = max_entries or config.getint(
+            "cache", "max_entries", fallback=100000
+        )
+        self.max_age = max_age or config.getfloat("cache", "max_age", fallback=180)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        import sqlite3
+
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False
+        )
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_result "
+                "(key TEXT PRIMARY KEY, text TEXT NOT NULL, used REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def key(content: bytes, ocr_service: str, language: str):
+        digest = hashlib.sha256(content).hexdigest()
+        return f"{ocr_service}:{language or ''}:{digest}"
+
+    def get(self, key):
+        with self._lock, self.connection:
+            row = self.connection.execute(
+                "SELECT text FROM ocr_result WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute(
+                "UPDATE ocr_result SET used = ? WHERE key = ?", (time.time(), key)
+            )
+            return row[0]
+
+    def put(self, key, text):
+        # an empty result may be a passing service failure, try again next time
+        if not text or not text.strip():
+            return
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ocr_result VALUES (?, ?, ?)",
+                (key, text, time.time()),
+            )
+
+    def evict(self):
+        with self._lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM ocr_result WHERE used < ?",
+                (time.time() - self.max_age * 24 * 3600,),
+            )
+            self.connection.execute(
+                "DELETE FROM ocr_result WHERE key IN (SELECT key FROM ocr_result "
+                "ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        self.evict()
+        self.connection.close()
+
+
+class OCRPool(object):
+    """
+    Run OCR requests on a thread pool so that the caller can keep rendering and
+    extracting text while they are outstanding.
+
+    At most `max_in_flight` requests run at once, all through `ocr_client`.
+    When the client batches, pictures are queued until a batch is full and
+    sent together; `flush` sends a partial batch. Every request is recorded as
+    an "ocr" stage of `profiler`, with the bytes of its pictures.
+    """
+
+    def __init__(
+        self, ocr_client, language, max_in_flight: int = 4, profiler=NULL_PROFILER
+    ):
+        self.ocr_client = ocr_client
+        self.language = language
+        self.profiler = profiler
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_in_flight))
+        self._batch = []  # (picture, future)
+        self._batch_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def submit(self, picture):
+        """Queue OCR of `picture`, return a Future of its text."""
+        if self.ocr_client.batch_size <= 1:
+            return self.executor.submit(self._get_ocr_result, picture)
+        future = Future()
+        size = picture.file_size
+        if self._batch and self._batch_bytes + size > self.ocr_client.batch_size_limit:
+            self.flush()
+        self._batch.append((picture, future))
+        self._batch_bytes += size
+        if len(self._batch) >= self.ocr_client.batch_size:
+            self.flush()
+        return future
+
+    def flush(self):
+        if self._batch:
+            self.executor.submit(self._get_batch_ocr_results, self._batch)
+            self._batch = []
+            self._batch_bytes = 0
+
+    def shutdown(self):
+        self.flush()
+        self.executor.shutdown(wait=True)
+
+    def _get_ocr_result(self, picture):
+        with self.profiler.stage("ocr") as stage:
+            stage.bytes = picture.file_size
+            return picture.get_ocr_result(
+                language=self.language,
+                ocr_service=self.ocr_client.ocr_service,
+                ocr_client=self.ocr_client,
+            )
+
+    def _get_batch_ocr_results(self, batch):
+        try:
+            with self.profiler.stage("ocr") as stage:
+                stage.bytes = sum(picture.file_size for picture, _ in batch)
+                texts = self.ocr_client.get_ocr_results_by_paddle(
+                    [picture for picture, _ in batch], self.language
+                )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), text in zip(batch, texts):
+            future.set_result(text)
+
+
+class RateLimiter(object):
+    """Space calls to `wait` at least 1 / `rate` seconds apart across threads."""
+
+    def __init__(self, rate: float):
+        self.min_interval = 1 / rate
+        self._lock = threading.Lock()
+        self._next_time = 0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            request_time = max(now, self._next_time)
+            self._next_time = request_time + self.min_interval
+        time.sleep(request_time - now)
+
+
+def parse_size(size: str):
+    """Convert a size like "512KB" or "4 MB" to bytes."""
+    match = re.match(r"([\d\.]+) *(MB|mb|KB|kb|B|b)?$", size.strip())
+    if not match:
+        raise Exception(f"Invalid size: {size}")
+    unit = (match.group(2) or "B").upper()
+    return int(float(match.group(1)) * {"B": 1, "KB": 1024, "MB": 1024 * 1024}[unit])
+
+
 class Language:
     Chinese_Simplified = "zh-Hans"
     Chinese_Traditional = "zh-Hant"
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+import contextlib
+import json
+import threading
+import time
+
+
+class Stage(object):
+    """One timed call of a stage, see StageProfiler.stage."""
+
+    __slots__ = ("profiler", "name", "page", "bytes", "start")
+
+    def __init__(self, profiler, name, page):
+        self.profiler = profiler
+        self.name = name
+        self.page = page
+        self.bytes = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(
+            self.name, time.perf_counter() - self.start, self.bytes, page=self.page
+        )
+
+
+class StageProfiler(object):
+    """
+    Record the wall time, number of calls and bytes of each stage of a run, in
+    total and per page:
+
+        with profiler.stage("render", page=3) as stage:
+            ...
+            stage.bytes = len(png)
+
+    Stages can be recorded from several threads. Those running in the
+    background, like OCR requests, overlap the others, so the stage times can
+    add up to more than the wall time. With `cprofile`, every function call made
+    in `run` is profiled as well.
+    """
+
+    enabled = True
+
+    def __init__(self, cprofile: bool = False):
+        self._lock = threading.Lock()
+        # stage -> [calls, seconds, bytes], the same per page
+        self.stages = {}
+        self.pages = {}
+        self.wall_seconds = 0.0
+        self.cprofile = None
+        if cprofile:
+            import cProfile
+
+            self.cprofile = cProfile.Profile()
+
+    @contextlib.contextmanager
+    def run(self):
+        """Time the whole run."""
+        if self.cprofile:
+            self.cprofile.enable()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.wall_seconds += time.perf_counter() - start
+            if self.cprofile:
+                self.cprofile.disable()
+
+    def stage(self, name: str, page: int = None):
+        return Stage(self, name, page)
+
+    def add(self, name: str, seconds: float, nbytes: int = 0, calls: int = 1, page: int = None):
+        with self._lock:
+            _add(self.stages, name, calls, seconds, nbytes)
+            if page is not None:
+                _add(self.pages.setdefault(page, {}), name, calls, seconds, nbytes)
+
+    def stats(self):
+        """The stages recorded so far, to be merged into another profiler, e.g.
+        in the parent of a worker process."""
+        with self._lock:
+            return {
+                "stages": {k: list(v) for k, v in self.stages.items()},
+                "pages": {
+                    page: {k: list(v) for k, v in stages.items()}
+                    for page, stages in self.pages.items()
+                },
+            }
+
+    def merge(self, stats: dict):
+        for name, (calls, seconds, nbytes) in stats["stages"].items():
+            self.add(name, seconds, nbytes, calls=calls)
+        with self._lock:
+            for page, stages in stats["pages"].items():
+                for name, (calls, seconds, nbytes) in stages.items():
+                    _add(self.pages.setdefault(page, {}), name, calls, seconds, nbytes)
+
+    def report(self):
+        with self._lock:
+            return {
+                "wall_seconds": self.wall_seconds,
+                "stages": _stage_dicts(self.stages),
+                "pages": {
+                    str(page): _stage_dicts(self.pages[page]) for page in sorted(self.pages)
+                },
+            }
+
+    def save(self, path: str, **extra):
+        """Write the report as JSON to `path`, along with the `extra` fields."""
+        with open(path, "w", encoding="utf-8") as data:
+            json.dump({**extra, **self.report()}, data, indent=2)
+
+    def save_cprofile(self, path: str):
+        """Dump the cProfile statistics to `path`, for pstats or snakeviz."""
+        if self.cprofile:
+            self.cprofile.dump_stats(path)
+
+
+class NullStage(object):
+    __slots__ = ("bytes",)
+
+    def __init__(self):
+        self.bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class NullProfiler(object):
+    """A StageProfiler that records nothing, the default everywhere."""
+
+    enabled = False
+    _stage = NullStage()
+
+    def run(self):
+        return contextlib.nullcontext(self)
+
+    def stage(self, name: str, page: int = None):
+        return self._stage
+
+    def add(self, name: str, seconds: float, nbytes: int = 0, calls: int = 1, page: int = None):
+        pass
+
+    def merge(self, stats: dict):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def _add(stages: dict, name: str, calls: int, seconds: float, nbytes: int):
+    stage = stages.get(name)
+    if stage is None:
+        stages[name] = [calls, seconds, nbytes]
+    else:
+        stage[0] += calls
+        stage[1] += seconds
+        stage[2] += nbytes
+
+
+def _stage_dicts(stages: dict):
+    return {
+        name: {"calls": calls, "seconds": seconds, "bytes": nbytes}
+        for name, (calls, seconds, nbytes) in stages.items()
+    }
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+import collections
+import contextlib
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+
+from pdf_handler import PdfHelper
+
+
+class DocumentCache(object):
+    """
+    The PdfHelper of the last `max_docs` files used, least recently used go
+    first. A file changed on disk since it was opened is opened again.
+    """
+
+    def __init__(self, max_docs: int = 8, compact_after: int = 20):
+        self.max_docs = max(1, max_docs)
+        self.compact_after = compact_after
+        # path -> ((mtime_ns, size), PdfHelper)
+        self._helpers = collections.OrderedDict()
+
+    def get(self, path: str):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._helpers.get(path)
+        if cached and cached[0] == signature:
+            self._helpers.move_to_end(path)
+            return cached[1]
+        self.discard(path)
+        helper = PdfHelper(path, compact_after=self.compact_after)
+        self._helpers[path] = (signature, helper)
+        while len(self._helpers) > self.max_docs:
+            _, (_, oldest) = self._helpers.popitem(last=False)
+            oldest.doc.close()
+        return helper
+
+    def discard(self, path: str):
+        cached = self._helpers.pop(os.path.abspath(path), None)
+        if cached:
+            cached[1].doc.close()
+
+    def close(self):
+        for path in list(self._helpers):
+            self.discard(path)
+
+
+class PdfServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Answer requests for PdfHelper methods on a Unix socket, keeping the
+    documents open between them.
+
+    A request is one line of JSON: {"path": PDF file, "method": PdfHelper
+    method, "args": {keyword arguments}}. The answer is one line of JSON:
+    {"result": return value, "output": what the method printed} or
+    {"error": message}. A connection can send any number of requests.
+
+    Every connection is read by its own thread, so an idle client doesn't keep
+    the others waiting. The requests themselves run one at a time: the
+    documents are shared and stdout is redirected for the whole process.
+    """
+
+    # don't wait for idle clients when shutting down
+    daemon_threads = True
+    block_on_close = False
+
+    # methods that leave the document as it is on disk
+    read_only_methods = [
+        "export_toc",
+        "export_xfdf_annots",
+        "format_annots",
+        "export_info",
+        "get_page_number",
+        "get_page_label",
+        "get_page_numbers",
+        "get_page_labels",
+    ]
+    # methods that change the document: it is opened again for the next request
+    write_methods = [
+        "import_toc_from_file",
+        "delete_annots",
+        "import_xfdf_annots",
+        "import_info",
+    ]
+
+    def __init__(self, socket_path: str, max_docs: int = 8, compact_after: int = 20):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # left by a server that didn't shut down
+        super().__init__(socket_path, PdfRequestHandler)
+        os.chmod(socket_path, 0o600)
+        self.socket_path = socket_path
+        self.documents = DocumentCache(max_docs=max_docs, compact_after=compact_after)
+        self._lock = threading.Lock()
+
+    def handle_pdf_request(self, request: dict):
+        method = request.get("method")
+        if method not in self.read_only_methods + self.write_methods:
+            raise Exception(f"Unsupported method: {method}")
+        path = request.get("path")
+        if not path:
+            raise Exception("No PDF file Found!")
+        with self._lock:
+            helper = self.documents.get(path)
+            output = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(output):
+                    result = getattr(helper, method)(**request.get("args", {}))
+            except BaseException:
+                self.documents.discard(path)
+                raise
+            if method in self.write_methods:
+                self.documents.discard(path)
+        return {"result": result, "output": output.getvalue()}
+
+    def server_close(self):
+        super().server_close()
+        with self._lock:
+            self.documents.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class PdfRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.handle_pdf_request(json.loads(line))
+                data = json.dumps(response, ensure_ascii=False, default=str)
+            except Exception as e:
+                data = json.dumps({"error": f"{type(e).__name__}: {e}"})
+            self.wfile.write(data.encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+def serve(socket_path: str, max_docs: int = 8, compact_after: int = 20):
+    # remove the socket on kill as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with PdfServer(
+        socket_path, max_docs=max_docs, compact_after=compact_after
+    ) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -1,8 +1,35 @@
 #!/usr/bin/env python3
 import argparse
+import collections
 
 import re
 
+# one line of a TOC file, match.lastgroup tells which kind:
+#   "  - title#page" or "  - title": an outline item, nested by indent
+#   "#number=physical": page `number` of the TOC is page `physical` of the
+#   PDF, e.g. "# 1=16"
+#   "#+n" or "#-n": shift the pages that follow by n
+#   "@label page=[prefix]rule": page labels from `page` on, e.g. "@label 8=i"
+TOC_LINE = re.compile(
+    r"(?P<toc>(?P<indent> *)[-+] "
+    r"(?:(?P<title>.+)# *(?P<page>\d+)|(?P<title_without_page>[^#]+)))"
+    r"|(?P<first_page> *# *(?P<first_page_number>\d+) *= *"
+    r"(?P<first_page_physical>-?\d+))"
+    r"|(?P<gap> *# *(?P<gap_value>[\+\-]\d+))"
+    r"|(?P<label>@label *(?P<label_page>\d+) *= *"
+    r"(?:[\[【（\(](?P<label_prefix>.*)[\]】）\)])? *(?P<label_rule>[\w\-]*))"
+)
+# (level, pattern) of the headings HeadingDetector knows by default
+DEFAULT_HEADING_PATTERNS = [
+    (1, r"第 *[\d零一二三四五六七八九十百千]+ *[章篇部]"),
+    (1, r"(?i)(?:chapter|part) +[\divxlc]+\b"),
+    (2, r"第 *[\d零一二三四五六七八九十百千]+ *节"),
+    (2, r"\d+\.\d+ +\S"),
+    (3, r"\d+\.\d+\.\d+ +\S"),
+]
+ROMAN_NUMERAL = re.compile(r"^M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})$")
+LETTERS = re.compile(r"^[a-zA-Z]+$")
+
 
 class TocHandler:
     def save_pymupdf_toc_to_file(
@@ -78,30 +105,23 @@ class TocHandler:
         except IOError as ioerr:
             print("File Error: " + str(ioerr))
 
-    def convert_toc_list_to_pymupdf_toc(self, toc_list: list):
+    def convert_toc_list_to_pymupdf_toc(self, toc_list):
+        """
+        Parse the lines of a TOC file, any iterable of them such as the open
+        file, into the TOC and the page labels of PyMuPDF. Every line is
+        classified by one match of TOC_LINE.
+        """
         toc = []
         page_labels = []
-        roman_numeral_pattern = (
-            r"^M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})$"
-        )
 
         page_gap = 0
         for line in toc_list:
-            page_match = re.match(r"( *)[-+] (.+)# *(\d+) *", line)
-            toc_without_page_match = re.match(r"( *)[-+] ([^#]+) *", line)
-            gap_match = re.match(r" *# *([\+\-]\d+)", line)
-            first_page_match = re.match(r" *# *(\d+) *= *(-?\d+) *", line)
-            label_match = re.match(
-                r"@label *(\d+) *= *([\[【（\(](.*)[\]】）\)])? *([\w\-]*)", line
-            )
+            match = TOC_LINE.match(line)
+            kind = match.lastgroup if match else None
             indent_step = 2
 
-            if page_match or toc_without_page_match:
-                current_indent = (
-                    len(page_match.group(1))
-                    if page_match
-                    else len(toc_without_page_match.group(1))
-                )
+            if kind == "toc":
+                current_indent = len(match.group("indent"))
                 if current_indent:
                     # NOTE No indentation in first row,
                     # run into this part after lvl assigned
@@ -112,36 +132,37 @@ class TocHandler:
                         lvl -= int((last_indent - current_indent) / indent_step)
                 else:
                     lvl = 1
-                title = (
-                    page_match.group(2)
-                    if page_match
-                    else toc_without_page_match.group(2)
-                )
-                page = int(page_match.group(3)) + page_gap if page_match else -1
+                page = match.group("page")
+                if page is not None:
+                    title = match.group("title")
+                    page = int(page) + page_gap
+                else:
+                    title = match.group("title_without_page")
+                    page = -1
                 toc.append([lvl, title, page])
                 last_indent = current_indent
-            elif first_page_match:
-                page_gap = int(first_page_match.group(2)) - int(
-                    first_page_match.group(1)
+            elif kind == "first_page":
+                page_gap = int(match.group("first_page_physical")) - int(
+                    match.group("first_page_number")
                 )
-            elif gap_match:
-                page_gap += int(gap_match.group(1))
-            elif label_match:
-                startpage = int(label_match.group(1)) - 1
-                prefix = label_match.group(3) or ""
-                rule = label_match.group(4) or ""
+            elif kind == "gap":
+                page_gap += int(match.group("gap_value"))
+            elif kind == "label":
+                startpage = int(match.group("label_page")) - 1
+                prefix = match.group("label_prefix") or ""
+                rule = match.group("label_rule") or ""
 
                 if rule == "":
                     # No rule specified, use empty style
                     style = ""
                     firstpagenum = 1
-                elif re.match(roman_numeral_pattern, rule.upper()):
+                elif ROMAN_NUMERAL.match(rule.upper()):
                     style = "R" if rule.isupper() else "r"
                     firstpagenum = roman_to_int(rule.upper())
                 elif rule.isdigit():
                     style = "D"
                     firstpagenum = int(rule)
-                elif re.match(r"^[a-zA-Z]+$", rule):
+                elif LETTERS.match(rule):
                     style = "A" if rule.isupper() else "a"
                     firstpagenum = letter_to_int(rule)
                 else:
@@ -160,10 +181,156 @@ class TocHandler:
                     raise Exception("Unsupported Format!")
         return toc, page_labels
 
-    def is_toc_item(self, text: str):
-        if re.match(r"^第 \d+ 章.+", text):
-            return True
-        return False
+
+class HeadingDetector:
+    """
+    Pick the headings out of the lines of a document and nest them into a TOC.
+
+    A line scores `pattern_score` when it matches one of `patterns`, (level,
+    pattern) pairs tried in order, 1 when its font is at least `larger` times
+    the size of the body text, 1 more at `much_larger` times, and 1 when it is
+    bold. Lines scoring `min_score` are headings: by default a pattern needs
+    a larger or bold font along with it, so that body text starting with a
+    number is left out, while a much larger font is enough alone. Headings
+    without a pattern are nested by font size, the largest first.
+
+    Pages with more than `max_per_page` headings are skipped, they are usually
+    the printed contents or an index. So is a heading repeating the one of the
+    page before, like a running header.
+    """
+
+    def __init__(
+        self,
+        patterns: list = None,
+        min_score: int = 2,
+        max_per_page: int = 4,
+        max_length: int = 80,
+        pattern_score: int = 1,
+        larger: float = 1.15,
+        much_larger: float = 1.5,
+    ):
+        self.patterns = [
+            (level, re.compile(pattern) if isinstance(pattern, str) else pattern)
+            for level, pattern in (
+                DEFAULT_HEADING_PATTERNS if patterns is None else patterns
+            )
+        ]
+        self.min_score = min_score
+        self.max_per_page = max_per_page
+        self.max_length = max_length
+        self.pattern_score = pattern_score
+        self.larger = larger
+        self.much_larger = much_larger
+
+    def pattern_level(self, text: str):
+        for level, pattern in self.patterns:
+            if pattern.match(text):
+                return level
+        return None
+
+    def score(self, text: str, size: float, bold: bool, body_size: float):
+        """Return (score, level of the matching pattern or None) of a line."""
+        level = self.pattern_level(text)
+        score = self.pattern_score if level is not None else 0
+        if body_size and size >= body_size * self.larger:
+            score += 1
+            if size >= body_size * self.much_larger:
+                score += 1
+        if bold:
+            score += 1
+        return score, level
+
+    def detect(self, pages):
+        """
+        Return the TOC of PyMuPDF for `pages`, in page order: (page number,
+        [(text, font size, bold), ...] of its short lines, {font size: number
+        of characters} of all its text).
+        """
+        pages = list(pages)
+        sizes = collections.Counter()
+        for _, _, page_sizes in pages:
+            sizes.update(page_sizes)
+        body_size = sizes.most_common(1)[0][0] if sizes else 0
+        headings = []  # (page, text, size, level or None)
+        last_page_texts = set()
+        for page_number, lines, _ in pages:
+            page_headings = []
+            for text, size, bold in lines:
+                if not is_heading_text(text, self.max_length):
+                    continue
+                score, level = self.score(text, size, bold, body_size)
+                if score >= self.min_score:
+                    page_headings.append((page_number, text, size, level))
+            if len(page_headings) > self.max_per_page:
+                page_headings = []
+            headings.extend(h for h in page_headings if h[1] not in last_page_texts)
+            last_page_texts = {h[1] for h in page_headings}
+        # headings without a pattern are nested by font size
+        size_levels = {
+            size: i + 1
+            for i, size in enumerate(
+                sorted({h[2] for h in headings if h[3] is None}, reverse=True)
+            )
+        }
+        toc = []
+        for page_number, text, size, level in headings:
+            level = level if level is not None else size_levels[size]
+            # a level can only go one deeper than the one before
+            level = min(level, toc[-1][0] + 1 if toc else 1)
+            toc.append([level, text, page_number])
+        return toc
+
+
+def is_heading_text(text: str, max_length: int = 80):
+    """Whether `text` can be a heading at all: short, with a letter in it."""
+    return 0 < len(text) <= max_length and any(c.isalpha() for c in text)
+
+
+class PageLabelIndex:
+    """
+    The labels of all pages of a document, computed once from its page label
+    rules (see TocHandler.convert_page_labels_to_text), and the first page of
+    every label.
+    """
+
+    def __init__(self, page_labels: list, page_count: int):
+        rules = sorted(page_labels, key=lambda x: x["startpage"])
+        self.labels = [""] * page_count
+        for i, rule in enumerate(rules):
+            end = rules[i + 1]["startpage"] if i + 1 < len(rules) else page_count
+            prefix = rule.get("prefix", "")
+            style = rule.get("style", "")
+            first = rule.get("firstpagenum", 1)
+            for page in range(max(0, rule["startpage"]), min(end, page_count)):
+                self.labels[page] = prefix + format_page_number(
+                    first + page - rule["startpage"], style
+                )
+        self.numbers = {}
+        for page, label in enumerate(self.labels):
+            if label:
+                self.numbers.setdefault(label, page)
+
+    def label(self, page: int):
+        """The label of 0-based `page`, "" when it has none."""
+        if not 0 <= page < len(self.labels):
+            raise ValueError("page not in document")
+        return self.labels[page]
+
+    def number(self, label: str):
+        """The first 0-based page labelled `label`, or None."""
+        return self.numbers.get(label)
+
+
+def format_page_number(number, style):
+    if style == "D":
+        return str(number)
+    if style in ["R", "r"]:
+        roman = int_to_roman(number)
+        return roman if style == "R" else roman.lower()
+    if style in ["A", "a"]:
+        letter = int_to_letter(number)
+        return letter.upper() if style == "A" else letter
+    return ""
 
 
 def roman_to_int(s):